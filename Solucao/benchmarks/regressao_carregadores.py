@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark de regressão dos carregadores `carregar_*`.
+
+Mede cada carregador direto no banco (sem st.cache_data nem cache compartilhado), com
+parâmetros fixos, e compara com a baseline JSON da escala do dataset. Falha (código 1)
+quando algum carregador fica mais lento que a baseline além da tolerância.
+
+Os datasets devem ser gerados de forma reproduzível, um por escala:
+
+    python docker/generate_data.py --seed 42 --end-date 2025-06-30 --scale 10
+
+Na pasta `Solucao` (credenciais de .streamlit/secrets.toml):
+
+    python -m benchmarks.regressao_carregadores --escala 10 --gravar-baseline   # primeira vez
+    python -m benchmarks.regressao_carregadores --escala 10                     # compara
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+from src import carregamento_de_dados as cd
+from src.indices import parametros_de_exemplo
+from src.organizacao_dos_dados import RECENCIA_PADRAO, FREQUENCIA_PADRAO, CLIENTES_POR_PAGINA
+
+
+DIRETORIO_BASELINES = os.path.join(os.path.dirname(__file__), 'baselines')
+TOLERANCIA_PADRAO = 0.20
+# Diferenças abaixo disso são ruído de medição, mesmo que passem da tolerância relativa
+PISO_MS = 5.0
+
+
+def chamadas_de_referencia(p):
+    """Carregador -> argumentos nomeados fixos (derivados do dataset, não da data de hoje)."""
+    inicio_6_meses = p['end_date'] - timedelta(days=180)
+    return {
+        'carregar_top_produtos': dict(store_id=p['store_id'], channel_name=p['channel_name'],
+                                      day_of_week='Quinta', hour_min=19, hour_max=23),
+        'carregar_cubo_produtos_loja': dict(store_id=p['store_id']),
+        'carregar_ticket_medio_por_canal': dict(start_date=inicio_6_meses, end_date=p['end_date']),
+        'carregar_ticket_medio_por_loja': dict(start_date=inicio_6_meses, end_date=p['end_date']),
+        'carregar_ticket_medio_canal_e_loja': dict(start_date=inicio_6_meses, end_date=p['end_date']),
+        'carregar_produtos_e_margem': dict(store_id=p['store_id']),
+        'carregar_performance_temporal': dict(store_id=p['store_id'], start_date=inicio_6_meses, end_date=p['end_date']),
+        'carregar_performance_por_regiao': dict(store_id=p['store_id'], start_date=inicio_6_meses, end_date=p['end_date']),
+        'carregar_produtos_e_margem_rede': {},
+        'carregar_performance_temporal_rede': dict(start_date=inicio_6_meses, end_date=p['end_date']),
+        'carregar_performance_por_regiao_rede': dict(start_date=inicio_6_meses, end_date=p['end_date']),
+        'carregar_dados_rfm_agregado': dict(data_analise=p['data_analise']),
+        'carregar_limites_rfm': dict(data_analise=p['data_analise']),
+        'carregar_segmento_rfm': dict(data_analise=p['data_analise'], recency_min=RECENCIA_PADRAO,
+                                      frequency_min=FREQUENCIA_PADRAO, limite=CLIENTES_POR_PAGINA, offset=0),
+        'carregar_distribuicao_frequencia': {},
+        'carregar_segmentos_rfm': dict(data_analise=p['data_analise']),
+    }
+
+
+def medir_carregador(nome, kwargs, repeticoes):
+    """Uma execução de aquecimento + `repeticoes` medidas, sempre indo ao banco."""
+    # __wrapped__ é a função original, sem as camadas de cache (functools.wraps)
+    funcao = getattr(cd, nome).__wrapped__
+    resultado = funcao(**kwargs)
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao(**kwargs)
+        tempos.append(1000 * (time.perf_counter() - inicio))
+    partes = resultado if isinstance(resultado, tuple) else (resultado,)
+    tempos.sort()
+    return {
+        'mediana_ms': statistics.median(tempos),
+        'p95_ms': tempos[min(len(tempos) - 1, int(0.95 * len(tempos)))],
+        'linhas': sum(len(parte) for parte in partes if hasattr(parte, 'columns')),
+    }
+
+
+def descrever_dataset(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*), MIN(created_at), MAX(created_at) FROM sales")
+        vendas, inicio, fim = cur.fetchone()
+        cur.execute("SHOW server_version")
+        versao = cur.fetchone()[0]
+    return {'vendas': vendas, 'inicio': str(inicio), 'fim': str(fim), 'postgres': versao}
+
+
+def comparar(medicoes, baseline, tolerancia):
+    """Lista de (carregador, atual_ms, baseline_ms) que regrediram."""
+    regressoes = []
+    for nome, medicao in medicoes.items():
+        referencia = baseline['carregadores'].get(nome)
+        if referencia is None:
+            continue
+        limite = referencia['mediana_ms'] * (1 + tolerancia)
+        if medicao['mediana_ms'] > limite and medicao['mediana_ms'] - referencia['mediana_ms'] > PISO_MS:
+            regressoes.append((nome, medicao['mediana_ms'], referencia['mediana_ms']))
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de regressão dos carregadores por escala do dataset')
+    parser.add_argument('--escala', required=True, help='Escala do dataset (mesmo valor do --scale do generate_data.py)')
+    parser.add_argument('--repeticoes', type=int, default=5, help='Medidas por carregador (após 1 de aquecimento)')
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_PADRAO,
+                        help='Piora relativa aceita na mediana (0.20 = 20%%)')
+    parser.add_argument('--gravar-baseline', action='store_true', help='Grava as medições como nova baseline')
+    args = parser.parse_args()
+
+    pool = cd.conexao_banco_de_dados()
+    with pool.conexao() as conn:
+        parametros = parametros_de_exemplo(conn)
+        dataset = descrever_dataset(conn)
+    print(f"Dataset: {dataset['vendas']:,} vendas ({dataset['inicio']} até {dataset['fim']}) · escala {args.escala}")
+
+    medicoes = {}
+    for nome, kwargs in chamadas_de_referencia(parametros).items():
+        medicoes[nome] = medir_carregador(nome, kwargs, args.repeticoes)
+        print(f"  {nome:<38} {medicoes[nome]['mediana_ms']:>9.1f} ms  (p95 {medicoes[nome]['p95_ms']:.1f} ms, {medicoes[nome]['linhas']:,} linhas)")
+
+    caminho = os.path.join(DIRETORIO_BASELINES, f"escala_{args.escala}.json")
+    if args.gravar_baseline:
+        os.makedirs(DIRETORIO_BASELINES, exist_ok=True)
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump({'dataset': dataset, 'carregadores': medicoes}, arquivo, ensure_ascii=False, indent=2)
+        print(f"✓ Baseline gravada em {caminho}")
+        return
+
+    if not os.path.exists(caminho):
+        print(f"✗ Baseline {caminho} não existe. Rode antes com --gravar-baseline.")
+        sys.exit(1)
+    with open(caminho, encoding='utf-8') as arquivo:
+        baseline = json.load(arquivo)
+    if baseline['dataset']['vendas'] != dataset['vendas']:
+        print(f"⚠️ O dataset mudou desde a baseline ({baseline['dataset']['vendas']:,} vendas): compare com cautela.")
+
+    regressoes = comparar(medicoes, baseline, args.tolerancia)
+    if regressoes:
+        for nome, atual, referencia in regressoes:
+            print(f"✗ {nome}: {atual:.1f} ms x baseline {referencia:.1f} ms (+{atual / referencia - 1:.0%})")
+        sys.exit(1)
+    print(f"✓ Nenhum carregador piorou mais que {args.tolerancia:.0%} em relação à baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Teste de carga do dashboard com várias sessões simultâneas.
+
+Cada sessão simulada roda a Homepage e as três páginas sem navegador (streamlit AppTest),
+repetindo o que um gerente faz de verdade: troca de loja, arraste do slider de horário,
+troca de dia da semana e mudança dos limites do RFM. Todas as sessões rodam no mesmo
+processo, compartilhando o pool de conexões e os caches (como num servidor Streamlit).
+
+O AppTest.run troca o st.secrets global do processo durante o rerun: dois reruns ao mesmo
+tempo disputariam esse estado. Por isso os reruns das sessões se alternam, um por vez
+(latência de cada rerun sem disputa), e a concorrência é medida à parte: N threads chamam
+os carregadores diretamente, com as mesmas chamadas das páginas, ao mesmo tempo.
+
+Para cada nível, o relatório traz p50/p95/p99 dos reruns e das chamadas concorrentes aos
+carregadores, o número de consultas ao banco e a memória (RSS) do processo.
+
+Pré-requisitos: banco populado pelo docker/generate_data.py e .streamlit/secrets.toml
+configurado (ver README). Rode na pasta `Solucao`:
+
+    python -m benchmarks.teste_de_carga --sessoes 1 5 10 20 --saida resultado.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import resource
+import threading
+import time
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import toml as tomllib
+
+from src.aquecimento_de_cache import tarefas_padrao
+from src.carregamento_de_dados import conexao_banco_de_dados
+from src.dimensoes import dimensoes
+from src.telemetria import resumo_por_carregador
+
+
+PAGINA_VENDAS = "pages/1_Vendas_e_Produtos.py"
+PAGINA_OPERACOES = glob.glob("pages/2_*.py")[0]
+PAGINA_CLIENTES = "pages/3_Clientes_e_Fidelidade.py"
+TIMEOUT_RERUN = 120
+# Lojas (sorteadas) cujo cubo de produtos cada sessão concorrente carrega
+LOJAS_POR_SESSAO = 3
+
+# AppTest.run troca o st.secrets global: um rerun por vez no processo
+_trava_do_apptest = threading.Lock()
+
+
+# --- CONFIGURAÇÃO DAS SESSÕES ---
+
+def _ler_segredos(caminho=os.path.join('.streamlit', 'secrets.toml')):
+    with open(caminho, 'rb') as arquivo:
+        conteudo = arquivo.read()
+    return tomllib.loads(conteudo.decode('utf-8'))
+
+
+def nova_sessao(segredos):
+    """AppTest da Homepage com os mesmos segredos do app."""
+    at = AppTest.from_file("Homepage.py", default_timeout=TIMEOUT_RERUN)
+    for chave, valor in segredos.items():
+        at.secrets[chave] = valor
+    return at
+
+
+# --- ROTEIRO DE UMA SESSÃO ---
+# Cada passo é (descrição, função que altera o AppTest e dispara o rerun).
+
+def _trocar_loja(chave):
+    def passo(at, rng):
+        selectbox = at.selectbox(key=chave)
+        selectbox.select_index(rng.randrange(len(selectbox.options))).run()
+    return passo
+
+
+def _arrastar_horario(at, rng):
+    inicio = rng.randint(0, 20)
+    at.slider(key='top_prod_hour').set_range(inicio, rng.randint(inicio + 1, 23)).run()
+
+
+def _trocar_dia(at, rng):
+    selectbox = at.selectbox(key='delivery_day_filter')
+    selectbox.select_index(rng.randrange(len(selectbox.options))).run()
+
+
+def _mudar_limites_rfm(at, rng):
+    recencia, frequencia = at.slider[0], at.slider[1]
+    recencia.set_value(rng.randrange(recencia.min, recencia.max + 1, recencia.step))
+    frequencia.set_value(rng.randint(frequencia.min, frequencia.max)).run()
+
+
+def roteiro(rng):
+    """Sequência de passos de uma sessão (a quantidade de cada interação varia entre sessões)."""
+    passos = [("homepage", lambda at, rng: at.run())]
+    passos.append(("vendas: abrir", lambda at, rng: at.switch_page(PAGINA_VENDAS).run()))
+    for _ in range(rng.randint(2, 4)):
+        passos.append(("vendas: horário", _arrastar_horario))
+    for _ in range(rng.randint(1, 3)):
+        passos.append(("vendas: loja", _trocar_loja('global_store_filter')))
+    passos.append(("operações: abrir", lambda at, rng: at.switch_page(PAGINA_OPERACOES).run()))
+    for _ in range(rng.randint(1, 3)):
+        passos.append(("operações: loja", _trocar_loja('global_store_filter_op')))
+    passos.append(("operações: dia", _trocar_dia))
+    passos.append(("clientes: abrir", lambda at, rng: at.switch_page(PAGINA_CLIENTES).run()))
+    for _ in range(rng.randint(2, 4)):
+        passos.append(("clientes: rfm", _mudar_limites_rfm))
+    return passos
+
+
+def executar_sessao(segredos, semente, resultados):
+    rng = random.Random(semente)
+    at = nova_sessao(segredos)
+    for descricao, passo in roteiro(rng):
+        na_fila = time.perf_counter()
+        with _trava_do_apptest:
+            # A latência do rerun começa quando ele ganha a vez; a espera na fila é medida à parte
+            inicio = time.perf_counter()
+            try:
+                passo(at, rng)
+                erro = str(at.exception[0].value) if at.exception else None
+            except Exception as e:
+                erro = str(e)
+            fim = time.perf_counter()
+        resultados.append({
+            'passo': descricao,
+            'latencia_ms': 1000 * (fim - inicio),
+            'espera_na_fila_ms': 1000 * (inicio - na_fila),
+            'erro': erro,
+        })
+        if erro:
+            break
+
+
+# --- CARREGADORES EM CONCORRÊNCIA ---
+# Sem AppTest: cada sessão chama os carregadores das páginas (mesmas chamadas do aquecimento,
+# com lojas sorteadas) e todas as sessões rodam ao mesmo tempo, disputando pool e caches.
+
+def executar_carregadores(semente, resultados):
+    rng = random.Random(semente)
+    lojas = dimensoes().lojas.ids_ativos
+    tarefas = tarefas_padrao(rng.sample(lojas, min(LOJAS_POR_SESSAO, len(lojas))))
+    rng.shuffle(tarefas)
+    for descricao, tarefa in tarefas:
+        inicio = time.perf_counter()
+        try:
+            tarefa()
+            erro = None
+        except Exception as e:
+            erro = str(e)
+        resultados.append({'passo': descricao, 'latencia_ms': 1000 * (time.perf_counter() - inicio), 'erro': erro})
+
+
+# --- MEDIÇÕES ---
+
+def _rss_mb():
+    """RSS atual do processo (Linux) ou o pico, onde /proc não existe."""
+    try:
+        with open('/proc/self/statm') as arquivo:
+            paginas = int(arquivo.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _consultas_no_banco():
+    """Chamadas de carregadores que foram ao banco e checkouts do pool (acumulados no processo)."""
+    banco = sum(r['banco'] for r in resumo_por_carregador())
+    return banco, conexao_banco_de_dados().metricas()['checkouts']
+
+
+def _percentil(valores, q):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(q * len(valores)))] if valores else None
+
+
+def _em_threads(alvo, sessoes, semente, nome):
+    """Roda `alvo(semente + i, resultados)` em `sessoes` threads; retorna (resultados, duração em s)."""
+    resultados = []
+    threads = [
+        threading.Thread(target=alvo, args=(semente + i, resultados), name=f"{nome}-{i}")
+        for i in range(sessoes)
+    ]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return resultados, time.perf_counter() - inicio
+
+
+def _latencias(resultados, prefixo):
+    latencias = [r['latencia_ms'] for r in resultados if not r['erro']]
+    return {f'{prefixo}_p{int(q * 100)}_ms': _percentil(latencias, q) for q in (0.50, 0.95, 0.99)}
+
+
+def medir_nivel(segredos, sessoes, semente, cache_frio=False):
+    """Roda `sessoes` sessões (reruns alternados + carregadores concorrentes) e retorna as métricas do nível."""
+    if cache_frio:
+        st.cache_data.clear()
+    banco_antes, checkouts_antes = _consultas_no_banco()
+    reruns, duracao_reruns = _em_threads(
+        lambda semente, resultados: executar_sessao(segredos, semente, resultados), sessoes, semente, "sessao"
+    )
+    if cache_frio:
+        st.cache_data.clear()
+    chamadas, duracao_chamadas = _em_threads(executar_carregadores, sessoes, semente, "carregadores")
+    banco_depois, checkouts_depois = _consultas_no_banco()
+
+    esperas = [r['espera_na_fila_ms'] for r in reruns]
+    return {
+        'sessoes': sessoes,
+        # Reruns do AppTest um por vez (sem disputa); só a fase dos carregadores é concorrente
+        'reruns_serializados': True,
+        'reruns': len(reruns),
+        'chamadas': len(chamadas),
+        'erros': [r for r in reruns + chamadas if r['erro']],
+        'duracao_reruns_s': duracao_reruns,
+        'duracao_chamadas_s': duracao_chamadas,
+        **_latencias(reruns, 'rerun'),
+        'espera_na_fila_p95_ms': _percentil(esperas, 0.95),
+        **_latencias(chamadas, 'carregador'),
+        'carregadores_no_banco': banco_depois - banco_antes,
+        'checkouts_do_pool': checkouts_depois - checkouts_antes,
+        'rss_mb': _rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga do dashboard com várias sessões (AppTest + carregadores)')
+    parser.add_argument('--sessoes', type=int, nargs='+', default=[1, 5, 10, 20],
+                        help='Níveis de concorrência (sessões simultâneas)')
+    parser.add_argument('--semente', type=int, default=42, help='Semente dos roteiros das sessões')
+    parser.add_argument('--cache-frio', action='store_true',
+                        help='Limpa o st.cache_data antes de cada fase (reruns e carregadores) de cada nível')
+    parser.add_argument('--saida', help='Arquivo JSON com o resultado de cada nível')
+    args = parser.parse_args()
+
+    segredos = _ler_segredos()
+    niveis = []
+    print("Reruns (AppTest): um por vez no processo, latência sem disputa; a fila é a espera pela vez.")
+    print("Chamadas (carregadores): as N sessões ao mesmo tempo; só esta fase mede concorrência real.")
+    print(f"{'sessões':>8} {'reruns':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'fila p95':>9} {'chamadas':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'banco':>6} {'checkouts':>10} {'RSS MB':>8} {'erros':>6}")
+    for sessoes in args.sessoes:
+        nivel = medir_nivel(segredos, sessoes, args.semente, args.cache_frio)
+        niveis.append(nivel)
+        print(f"{nivel['sessoes']:>8} {nivel['reruns']:>7} {nivel['rerun_p50_ms'] or 0:>9.0f} "
+              f"{nivel['rerun_p95_ms'] or 0:>9.0f} {nivel['rerun_p99_ms'] or 0:>9.0f} "
+              f"{nivel['espera_na_fila_p95_ms'] or 0:>9.0f} {nivel['chamadas']:>9} {nivel['carregador_p50_ms'] or 0:>9.0f} "
+              f"{nivel['carregador_p95_ms'] or 0:>9.0f} {nivel['carregador_p99_ms'] or 0:>9.0f} "
+              f"{nivel['carregadores_no_banco']:>6} {nivel['checkouts_do_pool']:>10} "
+              f"{nivel['rss_mb']:>8.0f} {len(nivel['erros']):>6}")
+        for erro in nivel['erros'][:3]:
+            print(f"   ✗ {erro['passo']}: {erro['erro']}")
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(niveis, arquivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -75,6 +75,11 @@ def get_db_connection(db_url):
     return psycopg2.connect(db_url)
 
 
+def today():
+    """Today at midnight: the default end date, stable within the day"""
+    return datetime.combine(datetime.now().date(), datetime.min.time())
+
+
 def get_hour_weight(hour):
     for hour_range, weight in HOURLY_WEIGHTS.items():
         if hour in hour_range:
@@ -130,10 +135,11 @@ def setup_base_data(conn):
     return sub_brand_ids, channel_ids
 
 
-def generate_stores(conn, sub_brand_ids, num_stores=50):
-    """Generate realistic stores"""
+def generate_stores(conn, sub_brand_ids, num_stores=50, end_date=None):
+    """Generate realistic stores (every date is relative to `end_date`)"""
     print(f"Generating {num_stores} stores...")
     cursor = conn.cursor()
+    end_date = end_date or today()
     stores = []
     
     cities = [fake.city() for _ in range(20)]
@@ -165,8 +171,8 @@ def generate_stores(conn, sub_brand_ids, num_stores=50):
             Decimal(str(round(base_lat, 6))),
             Decimal(str(round(base_long, 6))),
             is_active, is_own,
-            fake.date_between(start_date='-2y', end_date='-6m'),
-            datetime.now() - timedelta(days=random.randint(180, 720))
+            (end_date - timedelta(days=random.randint(180, 730))).date(),
+            end_date - timedelta(days=random.randint(180, 720))
         ))
         stores.append(cursor.fetchone()[0])
     
@@ -279,21 +285,22 @@ def generate_products_and_items(conn, sub_brand_ids, num_products=500, num_items
     return products, items, option_groups
 
 
-def generate_customers(conn, num_customers=10000):
-    """Generate customers"""
+def generate_customers(conn, num_customers=10000, end_date=None):
+    """Generate customers (every date is relative to `end_date`)"""
     print(f"Generating {num_customers} customers...")
     cursor = conn.cursor()
+    end_date = end_date or today()
     
     batch = []
     for _ in range(num_customers):
         batch.append((
             fake.name(), fake.email(), fake.phone_number(), fake.cpf(),
-            fake.date_of_birth(minimum_age=18, maximum_age=75),
+            (end_date - timedelta(days=random.randint(18 * 365, 75 * 365))).date(),
             random.choice(['M', 'F', 'NB', 'O']),
             random.choice([True, False]),
             random.choice([True, False, False]),  # 33% accept email
             random.choice(['qr_code', 'link', 'balcony', 'pos']),
-            datetime.now() - timedelta(days=random.randint(0, 720))
+            end_date - timedelta(days=random.randint(0, 720))
         ))
     
     execute_batch(cursor, """
@@ -311,13 +318,14 @@ def generate_customers(conn, num_customers=10000):
     return customer_ids
 
 
-def generate_sales(conn, stores, channels, products, items, option_groups, customers, months=6):
-    """Generate sales with realistic patterns"""
-    print(f"Generating sales for {months} months...")
+def generate_sales(conn, stores, channels, products, items, option_groups, customers, months=6,
+                   scale=1.0, end_date=None):
+    """Generate sales with realistic patterns (`scale` multiplies the daily volume)"""
+    print(f"Generating sales for {months} months (scale {scale:g}x)...")
     
     cursor = conn.cursor()
-    start_date = datetime.now() - timedelta(days=30 * months)
-    end_date = datetime.now()
+    end_date = end_date or today()
+    start_date = end_date - timedelta(days=30 * months)
     
     # Anomalies
     anomaly_week = start_date + timedelta(days=random.randint(30, 60))
@@ -339,7 +347,7 @@ def generate_sales(conn, stores, channels, products, items, option_groups, custo
         if current_date.date() == promo_day.date():
             day_mult *= 3.0
         
-        daily_sales = int(random.gauss(2700, 400) * day_mult)
+        daily_sales = int(random.gauss(2700, 400) * day_mult * scale)
         
         sales_batch = []
         
@@ -660,12 +668,14 @@ def create_indexes(conn):
     for idx in indexes:
         try:
             cursor.execute(idx)
-        except:
-            pass
-    
+        except psycopg2.Error as e:
+            # Falha ao criar índice não pode passar em silêncio: as consultas do dashboard dependem deles
+            conn.rollback()
+            print(f"✗ Error creating index: {idx}\n  {e}")
+            raise
     
     conn.commit()
-    print("✓ Indexes created")
+    print("✓ Indexes created (dashboard indexes: python -m src.indices in the Solucao folder)")
 
 
 def main():
@@ -677,28 +687,41 @@ def main():
     parser.add_argument('--items', type=int, default=200, help='Number of items/complements')
     parser.add_argument('--customers', type=int, default=10000, help='Number of customers')
     parser.add_argument('--months', type=int, default=6, help='Months of sales data')
+    parser.add_argument('--scale', type=float, default=1.0,
+                       help='Sales volume multiplier (1 = ~500k sales in 6 months; 10, 100 for benchmarks)')
+    parser.add_argument('--seed', type=int, default=None,
+                       help='Seed for random and Faker (same seed + same --end-date = same dataset)')
+    parser.add_argument('--end-date', type=lambda d: datetime.strptime(d, '%Y-%m-%d'), default=None,
+                       help='Last day of data, YYYY-MM-DD; every generated date derives from it (default: today)')
     
     args = parser.parse_args()
+    end_date = args.end_date or today()
+    
+    if args.seed is not None:
+        random.seed(args.seed)
+        Faker.seed(args.seed)
     
     print("=" * 70)
     print("God Level Coder Challenge - Data Generator")
     print("=" * 70)
     print(f"Generating {args.months} months of restaurant operational data...")
+    if args.seed is not None:
+        print(f"Seed: {args.seed} | Scale: {args.scale:g}x")
     print()
     
     conn = get_db_connection(args.db_url)
     
     try:
         sub_brand_ids, channels = setup_base_data(conn)
-        stores = generate_stores(conn, sub_brand_ids, args.stores)
+        stores = generate_stores(conn, sub_brand_ids, args.stores, end_date)
         products, items, option_groups = generate_products_and_items(
             conn, sub_brand_ids, args.products, args.items
         )
-        customers = generate_customers(conn, args.customers)
+        customers = generate_customers(conn, args.customers, end_date)
         
         total_sales = generate_sales(
             conn, stores, channels, products, items, 
-            option_groups, customers, args.months
+            option_groups, customers, args.months, args.scale, end_date
         )
         
         create_indexes(conn)
@@ -1,16 +1,17 @@
 import streamlit as st
-import time
 import plotly.express as px
-from src.carregamento_de_dados import carregar_top_produtos, carregar_ticket_medio_por_canal, carregar_produtos_e_margem, carregar_ticket_medio_por_loja
+from src.carregamento_de_dados import carregar_cubo_produtos_loja, carregar_ticket_medio_canal_e_loja, carregar_produtos_e_margem_rede
 from src.inicializador_global import inicializar_dados
-from src.organizacao_dos_dados import formatar_nome_loja
+from src.dimensoes import dimensoes
+from src.execucao_paralela import carregar_em_paralelo, aguardar
+from src.telemetria import exibir_telemetria
+from src.organizacao_dos_dados import top_produtos_do_cubo, reagregar_ticket, particao_da_loja
 
 # Inicializa os dados globais necessários para a aplicação
 inicializar_dados()
 
-# Recupera metadados
-df_stores = st.session_state['df_stores']
-df_channels = st.session_state['df_channels']
+# Recupera metadados (dicionário de dimensões compartilhado pelo processo)
+dims = dimensoes()
 
 
 # Configuração da página
@@ -22,25 +23,19 @@ st.title("💰 Análise de Vendas, Produtos e Margens")
 
 # --- FILTROS GLOBAIS ---
 # FILTRO DE LOJA E DATA (Barra Lateral)
-# Mapeia nome da loja para o ID
-store_name_id_map = dict(zip(df_stores['name'], df_stores['id']))
 # Filtros Únicos para esta página
 with st.sidebar:
     st.header("Filtros Globais")
     
-    store_options = df_stores['name'].unique()
-    store_options_formatted = [formatar_nome_loja(name) for name in store_options]
-    
-    selected_store_name_formatted = st.selectbox(
+    # As opções são os ids das lojas ativas; o nome exibido já vem formatado do dicionário
+    selected_store_id = st.selectbox(
         "Loja (Global):",
-        options=store_options_formatted,
+        options=dims.lojas.ids_ativos,
+        format_func=dims.lojas.exibicao,
         index=0,
         key='global_store_filter' # Adicionando chave para cada loja para evitar avisos
     )
-    
-    # Usando o nome original (invertido) para buscar o ID correto na query SQL
-    original_store_name = store_options[store_options_formatted.index(selected_store_name_formatted)]
-    selected_store_id = store_name_id_map[original_store_name]
+    selected_store_name_formatted = dims.lojas.exibicao(selected_store_id)
     
     # FILTRO DE DATA (SIDEBAR)
     date_range = st.date_input(
@@ -57,6 +52,16 @@ with st.sidebar:
 start_date = date_range[0]
 end_date = date_range[1]
 
+# --- DADOS DA PÁGINA ---
+# As três seções são independentes: as queries rodam ao mesmo tempo e cada seção
+# espera apenas pelo seu resultado (tempo da página = query mais lenta)
+dados_da_pagina = carregar_em_paralelo(
+    cubo_produtos=(carregar_cubo_produtos_loja, dict(store_id=selected_store_id)),
+    ticket_medio=(carregar_ticket_medio_canal_e_loja, dict(start_date=start_date, end_date=end_date)),
+    # Margem de todas as lojas numa leitura: trocar de loja só recorta o resultado em memória
+    margem=(carregar_produtos_e_margem_rede, dict()),
+)
+
 # --- DISPLAY DO CONTEXTO GLOBAL ---
 # Mostra o contexto atual dos filtros aplicados
 st.markdown("### 📊 Contexto Atual da Análise")
@@ -89,28 +94,23 @@ with st.container():
     col_a, col_b, col_c = st.columns(3)
     
     with col_a:
-        selected_channel = st.selectbox("Canal de Vendas:", options=df_channels['name'].unique(), key='top_prod_channel')
+        selected_channel = st.selectbox("Canal de Vendas:", options=dims.canais.nomes, key='top_prod_channel')
     with col_b:
         selected_day = st.selectbox("Dia da Semana:", options=["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"], index=3, key='top_prod_day')
     with col_c:
         selected_hour_range = st.slider("Janela de Horário:", 0, 23, (19, 23), key='top_prod_hour')
 
-    # Início da medição de latência
-    start_time = time.time()
-
-    # Carrega os dados otimizados para o gráfico dos Top Produtos
-    df_top_prods = carregar_top_produtos(
-        store_id=selected_store_id, 
+    # Carrega o cubo de produtos da loja (uma query por loja) e filtra em memória:
+    # mudar canal, dia ou arrastar o slider de horário não gera nenhuma query nova
+    cubo_produtos = aguardar(dados_da_pagina['cubo_produtos'], "Carregando o ranking de produtos...")
+    df_top_prods = top_produtos_do_cubo(
+        cubo_produtos,
         channel_name=selected_channel, 
         day_of_week=selected_day, 
         hour_min=selected_hour_range[0], 
         hour_max=selected_hour_range[1]
     )
 
-    # Fim da medição de latência
-    end_time = time.time()
-    latency = end_time - start_time
-
 # Visualização do gráfico de barras
 with st.expander("Clique para expandir o gráfico", expanded=False):
     if not df_top_prods.empty:
@@ -158,12 +158,8 @@ with st.expander("Clique para expandir o gráfico", expanded=False):
     else:
         st.info("Nenhuma venda encontrada para os filtros selecionados.")
     
-    # Exibe a latência da query
-    st.caption(f"Latência da Query (Cache): {latency:.2f} segundos")
-    if latency > 0.5:
-        st.warning("A latência está alta. Verifique o PostgreSQL ou a complexidade do JOIN.")
-    else:
-        st.success("Query executada rapidamente. Otimização SQL está funcionando.")
+    # Origem (cache/banco), tempo, linhas e tamanho da última chamada
+    exibir_telemetria(carregar_cubo_produtos_loja, store_id=selected_store_id)
 
 # Separador da página
 st.markdown("---")
@@ -180,16 +176,10 @@ with st.expander("Clique para expandir a análise diagnóstica", expanded=False)
     # Layout do diagnóstico sobre o canal
     st.subheader("1. Evolução Diária do Ticket Médio por Canal")
     st.caption("Foco: Identificar a causa-raiz. Qual canal (iFood, Rappi, etc.) está puxando a média para baixo?")
-    
-    # Início da medição de latência
-    start_time = time.time()
 
-    # Carrega dados agregados por data E canal (A partir da loja selecionada e para o período selecionado)
-    df_ticket_canal = carregar_ticket_medio_por_canal(start_date=start_date, end_date=end_date)
-
-    # Fim da medição de latência
-    end_time = time.time()
-    latency = end_time - start_time
+    # Carrega, em uma única query (GROUPING SETS), os agregados por data E canal e por data E loja
+    # para o período selecionado. O ranking de lojas abaixo reaproveita o mesmo resultado em cache.
+    df_ticket_canal, df_loja_ranking_raw, _ = aguardar(dados_da_pagina['ticket_medio'], "Carregando o ticket médio...")
 
     # Visualização do gráfico de linhas
     if not df_ticket_canal.empty:
@@ -233,13 +223,6 @@ with st.expander("Clique para expandir a análise diagnóstica", expanded=False)
         
         # Exibição do gráfico
         st.plotly_chart(fig_ticket, use_container_width=True)
-
-        # Exibe a latência da query
-        st.caption(f"Latência da Query (Cache): {latency:.2f} segundos")
-        if latency > 0.5:
-            st.warning("A latência está alta. Verifique o PostgreSQL ou a complexidade do JOIN.")
-        else:
-            st.success("Query executada rapidamente. Otimização SQL está funcionando.")
         
         st.markdown("---")
         
@@ -250,17 +233,9 @@ with st.expander("Clique para expandir a análise diagnóstica", expanded=False)
         st.markdown("**OBS**: Esse ranking reflete o período total selecionado no filtro global.")
         st.caption("Foco: Uma vez identificado o canal (no gráfico acima), veja qual loja está com o pior desempenho no período.")
         
-        # Início da medição de latência
-        start_time = time.time()
-        # Carregando os dados de ticket médio por loja (para o período selecionado)
-        df_loja_ranking_raw = carregar_ticket_medio_por_loja(start_date=start_date, end_date=end_date)
-
-        # Fim da medição de latência
-        end_time = time.time()
-        latency_t = end_time - start_time
-        
-        # Cálculo da Média Agregada por Loja no Pandas (usando a coluna original 'store_name')
-        df_loja_ranking = df_loja_ranking_raw.groupby('store_name')['avg_ticket'].mean().reset_index()
+        # Ticket médio do período por Loja, re-agregado de forma exata (soma / contagem) a partir
+        # das parciais diárias já em cache (usando a coluna original 'store_name')
+        df_loja_ranking = reagregar_ticket(df_loja_ranking_raw, por=['store_name'])[['store_name', 'avg_ticket']]
         df_loja_ranking = df_loja_ranking.rename(columns={
             'store_name': 'Loja', 
             'avg_ticket': 'Ticket Médio Período (R$)'
@@ -290,12 +265,8 @@ with st.expander("Clique para expandir a análise diagnóstica", expanded=False)
     else:
         st.info("Nenhum dado de Ticket Médio encontrado para o período.")
 
-    # Exibe a latência da query
-    st.caption(f"Latência da Query (Cache): {latency:.2f} segundos")
-    if latency > 0.5:
-        st.warning("A latência está alta. Verifique o PostgreSQL ou a complexidade do JOIN.")
-    else:
-        st.success("Query executada rapidamente. Otimização SQL está funcionando.")
+    # Origem (cache/banco), tempo, linhas e tamanho da última chamada
+    exibir_telemetria(carregar_ticket_medio_canal_e_loja, start_date=start_date, end_date=end_date)
 
 st.markdown("---")
 
@@ -309,16 +280,10 @@ st.caption("Para mudar a loja, utilize o filtro global na barra lateral.")
 
 # Exibição da tabela de produtos com baixa margem
 with st.expander("Clique para ver o ranking de margem", expanded=False):
-    # Início da medição de latência
-    start_time = time.time()
     
     # Carrega os dados otimizados de margem por produto
-    df_margin = carregar_produtos_e_margem(store_id=selected_store_id)
+    df_margin = particao_da_loja(aguardar(dados_da_pagina['margem'], "Carregando as margens..."), selected_store_id)
 
-    # Fim da medição de latência
-    end_time = time.time()
-    latency = end_time - start_time
-    
     if not df_margin.empty:
         # Renomeação e Filtragem das Colunas
         df_margin = df_margin.rename(columns={
@@ -346,9 +311,5 @@ with st.expander("Clique para ver o ranking de margem", expanded=False):
     else:
         st.info("Nenhum dado de Margem encontrado para esta loja.")
 
-    # Exibe a latência da query
-    st.caption(f"Latência da Query (Cache): {latency:.2f} segundos")
-    if latency > 0.5:
-        st.warning("A latência está alta. Verifique o PostgreSQL ou a complexidade do JOIN.")
-    else:
-        st.success("Query executada rapidamente. Otimização SQL está funcionando.")
\ No newline at end of file
+    # Origem (cache/banco), tempo, linhas e tamanho da última chamada
+    exibir_telemetria(carregar_produtos_e_margem_rede)
@@ -1,17 +1,18 @@
 import streamlit as st
-import time # Para medir a latência
-import pandas as pd
 import plotly.express as px # Importação para melhoria do gráfico
-from src.carregamento_de_dados import carregar_performance_temporal, carregar_performance_por_regiao
+from src.carregamento_de_dados import carregar_performance_temporal_rede, carregar_performance_por_regiao_rede
 from src.inicializador_global import inicializar_dados
-from src.organizacao_dos_dados import formatar_nome_loja
+from src.dimensoes import dimensoes
+from src.execucao_paralela import carregar_em_paralelo, aguardar
+from src.telemetria import exibir_telemetria
+from src.organizacao_dos_dados import periodo_anterior, particao_da_loja
 
 # Inicializa os dados globais necessários para a aplicação
 inicializar_dados()
 
-# Recupera metadados
-df_stores = st.session_state.get('df_stores', pd.DataFrame())
-if df_stores.empty:
+# Recupera metadados (dicionário de dimensões compartilhado pelo processo)
+lojas = dimensoes().lojas
+if not lojas.ids_ativos:
     st.error("Dados de Lojas não carregados. Por favor, recarregue a página inicial.")
     st.stop()
 
@@ -23,31 +24,47 @@ st.title("⏱️ Análise de Operações e Logística")
 
 # Informação adicional sobre como o usuário tem controle sobre os dados analisados
 with st.expander("💡 Caso queira altera o filtro:", expanded=False):
-    st.info("Para alterar a loja use a barra lateral à esquerda.")
+    st.info("Para alterar a loja ou o período de análise use a barra lateral à esquerda.")
 
 # --- FILTRO GLOBAL ---
 # FILTRO DE LOJA (Barra Lateral)
-# Mapeia nome da loja para o ID
-store_name_id_map = dict(zip(df_stores['name'], df_stores['id']))
 # Filtro Único para esta página
 with st.sidebar:
     st.header("Filtros Globais")
     
-    store_options = df_stores['name'].unique()
-    store_options_formatted = [formatar_nome_loja(name) for name in store_options]
-    
-    selected_store_name_formatted = st.selectbox(
+    # As opções são os ids das lojas ativas; o nome exibido já vem formatado do dicionário
+    selected_store_id = st.selectbox(
         "Loja para Análise:",
-        options=store_options_formatted,
+        options=lojas.ids_ativos,
+        format_func=lojas.exibicao,
         index=0,
         key='global_store_filter_op' # Adicionando chave para cada loja para evitar avisos
     )
+    selected_store_name_formatted = lojas.exibicao(selected_store_id)
     
-    # Usando o nome original (invertido) para buscar o ID correto na query SQL
-    original_store_name = store_options[store_options_formatted.index(selected_store_name_formatted)]
-    selected_store_id = store_name_id_map[original_store_name]
+    # FILTRO DE DATA (SIDEBAR) - limita as queries à janela escolhida em vez de todo o histórico
+    date_range = st.date_input(
+        "Período de Análise:",
+        value=(st.session_state['start_date'], st.session_state['end_date']),
+        key='page2_date_range'
+    )
     
-    st.info("💡 Este filtro afeta TODAS as análises nesta página.")
+    st.info("💡 Estes filtros afetam TODAS as análises nesta página.")
+
+# Determina as datas de início e fim para as queries
+start_date = date_range[0]
+end_date = date_range[1]
+
+# Período anterior de mesma duração (comparativo do P90)
+inicio_anterior, fim_anterior = periodo_anterior(start_date, end_date)
+
+# As queries das abas (e do comparativo) rodam ao mesmo tempo. Cada uma traz TODAS as lojas
+# (modo frota): trocar de loja só recorta o resultado em memória, sem nova consulta.
+dados_da_pagina = carregar_em_paralelo(
+    temporal=(carregar_performance_temporal_rede, dict(start_date=start_date, end_date=end_date)),
+    temporal_anterior=(carregar_performance_temporal_rede, dict(start_date=inicio_anterior, end_date=fim_anterior)),
+    regiao=(carregar_performance_por_regiao_rede, dict(start_date=start_date, end_date=end_date)),
+)
 
 st.markdown("---")
 
@@ -55,7 +72,7 @@ st.markdown("---")
 st.subheader(f"Dashboard de Entrega para a Loja: **{selected_store_name_formatted}**")
 
 # Abas para separar as análises (Temporal e Geográfica)
-tab1, tab2 = st.tabs(["Análise Temporal (Dia/Hora)", "Análise Geográfica (Bairros)"])
+tab1, tab2, tab3 = st.tabs(["Análise Temporal (Dia/Hora)", "Análise Geográfica (Bairros)", "Comparativo entre Lojas"])
 
 # Dicionário auxiliar para mapear o número do dia da semana (Postgres) para nome
 DAY_MAP = {
@@ -78,16 +95,9 @@ with tab1:
     
     # Reverte o nome para o número SQL (0-6) para o filtro
     selected_day_num = [k for k, v in DAY_MAP.items() if v == selected_day][0]
-    
-    # Início da medição de latência
-    start_time_t = time.time()
 
-    # Carrega os dados (agora agregados por dia e hora)
-    df_temporal_raw = carregar_performance_temporal(store_id=selected_store_id)
-    
-    # Fim da medição de latência
-    end_time_t = time.time()
-    latency_t = end_time_t - start_time_t
+    # Carrega os dados (agora agregados por dia e hora) do período selecionado
+    df_temporal_raw = particao_da_loja(aguardar(dados_da_pagina['temporal'], "Carregando o desempenho por horário...")[0], selected_store_id)
 
     # Gráfico Temporal (Filtrado pelo dia selecionado)
     if not df_temporal_raw.empty:
@@ -97,7 +107,8 @@ with tab1:
         # Caso não haja dados para o dia selecionado
         if df_temporal.empty:
              st.info(f"Nenhuma entrega encontrada para a {selected_day} nesta loja.")
-             st.caption(f"Latência da Query Temporal (Cache): {latency_t:.2f} segundos")
+             # Origem (cache/banco), tempo, linhas e tamanho da última chamada
+             exibir_telemetria(carregar_performance_temporal_rede, start_date=start_date, end_date=end_date)
              st.stop()
 
         # Renomeando Colunas
@@ -140,6 +151,20 @@ with tab1:
         # Exibe o gráfico
         st.plotly_chart(fig_temporal, use_container_width=True)
 
+        # Comparativo com o período anterior de mesma duração (leitura pequena no rollup, sem varrer o histórico)
+        df_temporal_anterior = particao_da_loja(aguardar(dados_da_pagina['temporal_anterior'], "Carregando o período anterior...")[0], selected_store_id)
+        if not df_temporal_anterior.empty:
+            df_dia_anterior = df_temporal_anterior[df_temporal_anterior['day_of_week_num'] == selected_day_num]
+            if not df_dia_anterior.empty:
+                p90_atual = df_temporal['P90 Entrega (Min)'].max()
+                p90_anterior = df_dia_anterior['p90_delivery_minutes'].max()
+                st.metric(
+                    label=f"Pior P90 da {selected_day} x período anterior ({inicio_anterior.strftime('%d/%m/%Y')} até {fim_anterior.strftime('%d/%m/%Y')})",
+                    value=f"{p90_atual:.1f} min",
+                    delta=f"{p90_atual - p90_anterior:+.1f} min",
+                    delta_color="inverse" # Tempo de entrega subindo é ruim
+                )
+
 
         # Aviso de Anomalia no P90 quando muito alto em determinado horário
         pico_p90 = df_temporal.loc[df_temporal['P90 Entrega (Min)'].idxmax()]
@@ -152,8 +177,8 @@ with tab1:
     else:
         st.info("Nenhum dado temporal encontrado para esta loja.")
     
-    # Exibe a latência da query
-    st.caption(f"Latência da Query Temporal (Cache): {latency_t:.2f} segundos")
+    # Origem (cache/banco), tempo, linhas e tamanho da última chamada
+    exibir_telemetria(carregar_performance_temporal_rede, start_date=start_date, end_date=end_date)
 
 # SESSÃO 2: ANÁLISE GEOGRÁFICA (Regiões e Anomalias)
 # Análise Geográfica por Bairro
@@ -161,16 +186,9 @@ with tab1:
 with tab2:
     st.markdown("#### Performance Média e P90 por Bairro")
     st.info("Compare a eficiência da entrega entre os bairros atendidos. P90 alto em bairros próximos pode indicar problemas de rota.")
-    
-    # Início da medição de latência
-    start_time_g = time.time()
-    
+
     # Carrega os dados otimizados para o gráfico geográfico
-    df_geografica = carregar_performance_por_regiao(store_id=selected_store_id)
-    
-    # Fim da medição de latência
-    end_time_g = time.time()
-    latency_g = end_time_g - start_time_g
+    df_geografica = particao_da_loja(aguardar(dados_da_pagina['regiao'], "Carregando o desempenho por bairro..."), selected_store_id)
 
     # Visualização da Tabela de Bairros
     if not df_geografica.empty:
@@ -178,7 +196,9 @@ with tab2:
         df_geografica = df_geografica.rename(columns={
             'neighborhood': 'Bairro',
             'avg_delivery_minutes': 'Tempo Médio (Min)',
+            'p50_delivery_minutes': 'P50 Entrega (Min)',
             'p90_delivery_minutes': 'P90 Entrega (Min)',
+            'p99_delivery_minutes': 'P99 Entrega (Min)',
             'total_deliveries': 'Total Entregas'
         })
         
@@ -189,7 +209,9 @@ with tab2:
         st.dataframe(
             df_display.style.format({
                 'Tempo Médio (Min)': "{:.1f}", 
+                'P50 Entrega (Min)': "{:.1f}",
                 'P90 Entrega (Min)': "{:.1f}",
+                'P99 Entrega (Min)': "{:.1f}",
                 'Total Entregas': "{:,.0f}"
             })
             # Aplica gradiente: Vermelho no P90 mais alto (indicando pior desempenho)
@@ -208,5 +230,57 @@ with tab2:
             f"\n\n👉 **Ação:** Investigue rotas, trânsito ou a distância física para este bairro para otimizar a velocidade de entrega."
             )
 
-    # Exibe a latência da query
-    st.caption(f"Latência da Query Geográfica (Cache): {latency_g:.2f} segundos")
\ No newline at end of file
+    # Origem (cache/banco), tempo, linhas e tamanho da última chamada
+    exibir_telemetria(carregar_performance_por_regiao_rede, start_date=start_date, end_date=end_date)
+
+# SESSÃO 3: COMPARATIVO ENTRE LOJAS
+# Sai da mesma leitura da rede usada na aba temporal, sem consulta extra
+with tab3:
+    st.markdown("#### Tempo de Entrega de Todas as Lojas no Período")
+    st.info("Compare a loja selecionada (📍) com o restante da rede. P90 muito acima das demais indica um problema local de operação.")
+
+    _, df_comparativo = aguardar(dados_da_pagina['temporal'], "Carregando o comparativo entre lojas...")
+
+    if not df_comparativo.empty:
+        selecionada = df_comparativo['store_id'] == selected_store_id
+        df_comparativo = df_comparativo.assign(
+            Loja=[
+                lojas.exibicao(store_id) + (" 📍" if marcada else "")
+                for store_id, marcada in zip(df_comparativo['store_id'], selecionada)
+            ]
+        ).sort_values('p90_delivery_minutes', ascending=False)
+
+        # Posição da loja selecionada no ranking do P90 (1 = entrega mais lenta da rede)
+        posicoes = df_comparativo['store_id'].reset_index(drop=True)
+        if selecionada.any():
+            posicao = int(posicoes[posicoes == selected_store_id].index[0]) + 1
+            st.metric(
+                label="Posição da loja no P90 da rede (1 = mais lenta)",
+                value=f"{posicao}º de {len(posicoes)}"
+            )
+
+        df_display = df_comparativo[['Loja', 'total_deliveries', 'avg_delivery_minutes', 'p50_delivery_minutes',
+                                     'p90_delivery_minutes', 'p99_delivery_minutes']].rename(columns={
+            'total_deliveries': 'Total Entregas',
+            'avg_delivery_minutes': 'Tempo Médio (Min)',
+            'p50_delivery_minutes': 'P50 Entrega (Min)',
+            'p90_delivery_minutes': 'P90 Entrega (Min)',
+            'p99_delivery_minutes': 'P99 Entrega (Min)',
+        })
+        st.dataframe(
+            df_display.style.format({
+                'Tempo Médio (Min)': "{:.1f}",
+                'P50 Entrega (Min)': "{:.1f}",
+                'P90 Entrega (Min)': "{:.1f}",
+                'P99 Entrega (Min)': "{:.1f}",
+                'Total Entregas': "{:,.0f}"
+            })
+            .background_gradient(subset=['P90 Entrega (Min)'], cmap='Reds', high=0.5),
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.info("Nenhuma entrega encontrada na rede para este período.")
+
+    # Origem (cache/banco), tempo, linhas e tamanho da última chamada
+    exibir_telemetria(carregar_performance_temporal_rede, start_date=start_date, end_date=end_date)
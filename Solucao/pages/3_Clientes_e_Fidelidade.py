@@ -1,10 +1,11 @@
 import streamlit as st
-import time # Para medir a latência
-import pandas as pd
+import math
 import plotly.express as px # Usado para o gráfico de distribuição
 from datetime import date
-from src.carregamento_de_dados import carregar_dados_rfm_agregado
+from src.carregamento_de_dados import carregar_limites_rfm, carregar_segmento_rfm, carregar_distribuicao_frequencia, carregar_segmentos_rfm
 from src.inicializador_global import inicializar_dados
+from src.telemetria import exibir_telemetria
+from src.organizacao_dos_dados import RECENCIA_PADRAO, FREQUENCIA_PADRAO, CLIENTES_POR_PAGINA
 
 # Inicializa os dados globais necessários para a aplicação
 inicializar_dados()
@@ -32,18 +33,13 @@ with st.expander("❓ O que é o Modelo RFM?", expanded=False):
 # A data de análise é sempre HOJE
 TODAY_DATE = date.today()
 # --- SESSÃO 1 RFM AGREGADA ---
-# Início da medição de latência
-start_time_rfm = time.time()
+# Apenas os limites da base (total de clientes, maior recência e maior frequência).
+# Filtros, ordenação e contagens são feitos no banco: a página não carrega a base inteira.
+df_limites_rfm = carregar_limites_rfm(data_analise=TODAY_DATE)
 
-# Chamada da Função Otimizada (Resultado: 10.000 linhas, que é rápido de processar no Pandas)
-df_rfm = carregar_dados_rfm_agregado(data_analise=TODAY_DATE)
-
-end_time_rfm = time.time()
-latency_rfm = end_time_rfm - start_time_rfm
-
-# Fim da medição de latência
-st.caption(f"Latência da Query RFM Agregada (Cache): {latency_rfm:.2f} segundos")
-if df_rfm.empty:
+# Origem (cache/banco), tempo, linhas e tamanho da última chamada
+exibir_telemetria(carregar_limites_rfm, data_analise=TODAY_DATE)
+if df_limites_rfm.empty or df_limites_rfm['total_clientes'].iloc[0] == 0:
     st.error("Não foi possível carregar os dados de RFM. Verifique a conexão com o banco.")
     st.stop()
 
@@ -52,8 +48,8 @@ st.markdown("---")
 # --- FILTROS DE SEGMENTAÇÃO ---
 
 # Determina os limites para os sliders
-max_recency = int(df_rfm['recency_days'].max()) if not df_rfm.empty else 365
-max_frequency = int(df_rfm['frequency'].max()) if not df_rfm.empty else 100
+max_recency = max(int(df_limites_rfm['max_recency'].iloc[0]), 2)
+max_frequency = max(int(df_limites_rfm['max_frequency'].iloc[0]), 2)
 
 # Dados dinâmicos sobre os clientes
 st.header("📊 Segmentação Dinâmica de Clientes")
@@ -66,14 +62,14 @@ col_rec, col_freq = st.columns(2)
 with col_rec:
     recency_threshold = st.slider(
         "Recência (Dias Sem Comprar):", 
-        min_value=1, max_value=max_recency, value=30, step=7,
+        min_value=1, max_value=max_recency, value=min(RECENCIA_PADRAO, max_recency), step=7,
         help="Dias desde a última compra. Valores altos indicam maior risco."
     )
 # Filtro de Frequência
 with col_freq:
     frequency_threshold = st.slider(
         "Frequência (Mínimo de Compras):",
-        min_value=1, max_value=max_frequency, value=3,
+        min_value=1, max_value=max_frequency, value=min(FREQUENCIA_PADRAO, max_frequency),
         help="Quantidade mínima de compras que o cliente fez antes de sumir."
     )
 
@@ -81,23 +77,38 @@ st.markdown("---")
 
 # --- CLIENTES EM RISCO E RETENÇÃO ---
 # Abas para separar as análises
-tab1, tab2 = st.tabs(["Segmentação de Clientes (RFM Personalizado)", "Distribuição de Lealdade"])
+tab1, tab2, tab3 = st.tabs(["Segmentação de Clientes (RFM Personalizado)", "Distribuição de Lealdade", "Segmentos RFM (Quintis)"])
 
 # Análise de Clientes em Risco
 # Visualização dos dados da análise do risco de perda de clientes
 with tab1:
-    df_clientes_selecionados = df_rfm[
-        (df_rfm['recency_days'] > recency_threshold) & 
-        (df_rfm['frequency'] >= frequency_threshold)
-    ].sort_values('monetary', ascending=False)
+    # Página atual da lista (o seletor fica abaixo da tabela, então lemos o valor da execução anterior)
+    pagina = st.session_state.get('rfm_pagina', 1)
+
+    # Só a página pedida vem do banco, já filtrada e ordenada por valor gasto
+    df_clientes_selecionados, total_selecionados = carregar_segmento_rfm(
+        data_analise=TODAY_DATE,
+        recency_min=recency_threshold,
+        frequency_min=frequency_threshold,
+        limite=CLIENTES_POR_PAGINA,
+        offset=(pagina - 1) * CLIENTES_POR_PAGINA
+    )
+    total_paginas = max(1, math.ceil(total_selecionados / CLIENTES_POR_PAGINA))
+    # Se os filtros mudaram e a página atual deixou de existir, volta para a primeira
+    if pagina > total_paginas:
+        st.session_state['rfm_pagina'] = pagina = 1
+        df_clientes_selecionados, total_selecionados = carregar_segmento_rfm(
+            data_analise=TODAY_DATE,
+            recency_min=recency_threshold,
+            frequency_min=frequency_threshold,
+            limite=CLIENTES_POR_PAGINA,
+            offset=0
+        )
     
-    # Renomeando colunas
-    df_clientes_selecionados_display = df_clientes_selecionados[['customer_name', 'recency_days', 'frequency', 'monetary']].head(50).rename(columns={
-        'customer_name': 'Nome do Cliente',
-        'recency_days': 'Recência (Dias)',
-        'frequency': 'Frequência (Total)',
-        'monetary': 'Gasto Total (R$)'
-    })
+    # Renomeando colunas (a página vem como tabela Arrow: seleção e renomeação sem passar pelo pandas)
+    df_clientes_selecionados_display = df_clientes_selecionados.select(
+        ['customer_name', 'recency_days', 'frequency', 'monetary']
+    ).rename_columns(['Nome do Cliente', 'Recência (Dias)', 'Frequência (Total)', 'Gasto Total (R$)'])
     # Título e descrição
     st.markdown("#### Lista de Alvo Gerada pelos Filtros")
     st.info(f"Critérios Atuais: Sumiram há mais de **{recency_threshold} dias** E compraram **{frequency_threshold} ou mais vezes** antes.")
@@ -105,24 +116,32 @@ with tab1:
     # Total de clientes de acordo com os filtros
     st.metric(
         label=f"Total de Clientes que não compram a {recency_threshold} dias e compraram {frequency_threshold}+ vezes",
-        value=f"{len(df_clientes_selecionados):,}".replace(",", ".")
+        value=f"{total_selecionados:,}".replace(",", ".")
     )
     
     # Visualização da tabela de clientes de acordo com os filtros
     st.markdown("##### Detalhe dos Clientes (Priorizar quem gastou mais)")
+    # A formatação fica no column_config (no navegador), então a tabela Arrow é enviada como está
     st.dataframe(
-        df_clientes_selecionados_display.style.format({
-            "Gasto Total (R$)": "R$ {:,.2f}",
-            "Recência (Dias)": "{:,.0f} dias",
-            "Frequência (Total)": "{:,.0f}x"
-        })
-        # Destaque em Amarelo/Vermelho para Recência ALTA (clientes sumidos há muito tempo)
-        .background_gradient(subset=['Recência (Dias)'], cmap='YlOrRd', low=0.1, high=0.8),
+        df_clientes_selecionados_display,
+        column_config={
+            "Gasto Total (R$)": st.column_config.NumberColumn(format="R$ %.2f"),
+            # Barra para Recência ALTA (clientes sumidos há muito tempo)
+            "Recência (Dias)": st.column_config.ProgressColumn(format="%d dias", min_value=0, max_value=max_recency),
+            "Frequência (Total)": st.column_config.NumberColumn(format="%dx"),
+        },
         hide_index=True
     )
+
+    # Seletor de página da lista
+    st.number_input(
+        f"Página (de {total_paginas}):",
+        min_value=1, max_value=total_paginas, step=1,
+        key='rfm_pagina'
+    )
     
     st.warning(
-        f"**OBSERVAÇÃO:** Esta lista de {len(df_clientes_selecionados)} clientes são seus alvos prioritários. Quanto mais vermelho o campo 'Recência', mais urgente é a reativação."
+        f"**OBSERVAÇÃO:** Esta lista de {total_selecionados} clientes são seus alvos prioritários. Quanto mais cheia a barra de 'Recência', mais urgente é a reativação."
     )
 
 # --- SESSÃO 2 DISTRIBUIÇÃO DE FREQUÊNCIA ---
@@ -132,13 +151,11 @@ with tab2:
     st.markdown("#### Distribuição da Frequência de Compra")
     st.info("Mostra como sua base de clientes se distribui em termos de lealdade.")
     
-    # Criando grupos de frequência
-    bins = [0, 3, 10, df_rfm['frequency'].max() + 1]
-    labels = ['1-3x (Novos/Ocasionais)', '4-10x (Leais)', '10+x (Melhores/VIP)']
-    df_rfm['frequency_group'] = pd.cut(df_rfm['frequency'], bins=bins, labels=labels, right=False)
-    
-    df_frequency_count = df_rfm['frequency_group'].value_counts().reset_index()
-    df_frequency_count.columns = ['Quantidade de Vezes (Frequência)', 'Total de Clientes']
+    # Grupos de frequência contados no banco (sem alterar nenhum DataFrame em cache)
+    df_frequency_count = carregar_distribuicao_frequencia().rename(columns={
+        'frequency_group': 'Quantidade de Vezes (Frequência)',
+        'total_clientes': 'Total de Clientes'
+    })
     
     # Plotly
     fig_freq = px.bar(
@@ -170,4 +187,34 @@ with tab2:
     
     st.success(
         "**INSIGHT (Sócio/Marketing):** O maior grupo deve ser o de 'Novos/Ocasionais'. O foco estratégico deve ser criar programas de fidelidade para mover esses clientes para os segmentos 'Leais' e 'Melhores/VIP'."
-    )
\ No newline at end of file
+    )
+
+# --- SESSÃO 3 SEGMENTOS RFM POR QUINTIS ---
+# Cada cliente recebe notas de 1 a 5 em Recência, Frequência e Valor (quintis da base)
+with tab3:
+    st.markdown("#### Segmentos RFM da Base de Clientes")
+    st.info("Cada cliente recebe uma nota de 1 a 5 (5 = melhor) em Recência, Frequência e Valor, comparado com o resto da base. Os segmentos combinam essas notas.")
+
+    df_segmentos = carregar_segmentos_rfm(data_analise=TODAY_DATE).rename(columns={
+        'segmento': 'Segmento',
+        'total_clientes': 'Total de Clientes',
+        'avg_recency_days': 'Recência Média (Dias)',
+        'avg_frequency': 'Frequência Média',
+        'total_monetary': 'Gasto Total (R$)',
+        'avg_m_score': 'Nota Média de Valor (1-5)'
+    })
+
+    st.dataframe(
+        df_segmentos.style.format({
+            'Total de Clientes': "{:,.0f}",
+            'Recência Média (Dias)': "{:,.0f} dias",
+            'Frequência Média': "{:,.1f}x",
+            'Gasto Total (R$)': "R$ {:,.2f}",
+            'Nota Média de Valor (1-5)': "{:.1f}"
+        }),
+        hide_index=True
+    )
+
+    st.warning(
+        "**AÇÃO:** Priorize o segmento **'Em Risco'** (compravam com frequência e sumiram) com campanhas de reativação, e recompense os **'Campeões'** para mantê-los."
+    )
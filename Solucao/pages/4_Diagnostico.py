@@ -0,0 +1,165 @@
+import streamlit as st
+import pandas as pd
+import src.aquecimento_de_cache as aquecimento
+from src.carregamento_de_dados import conexao_banco_de_dados
+from src.consultas import CONSULTAS, TEMPOS_DAS_CONSULTAS, medir_planejamento
+from src.consultas_lentas import capturas_recentes
+from src.indices import parametros_de_exemplo
+from src.inicializador_global import inicializar_dados
+from src.telemetria import resumo_por_carregador, formatar_prometheus
+from src.tipos_compactos import relatorio_de_compactacao
+from src.versao_dos_dados import metricas_de_revalidacao
+
+# Inicializa os dados globais necessários para a aplicação
+inicializar_dados()
+
+# Configuração da página
+st.set_page_config(layout="wide")
+
+# Layout da página 4 - Diagnóstico (uso interno)
+st.title("🩺 Diagnóstico de Desempenho")
+st.caption("Página interna: métricas do processo atual (todas as sessões), desde que o app subiu.")
+
+if st.button("Atualizar métricas"):
+    st.rerun()
+
+# --- SESSÃO 1: CARREGADORES ---
+st.header("Carregadores")
+st.info("Origem dos resultados (cache local, cache compartilhado ou banco) e percentis das últimas chamadas de cada `carregar_*`.")
+
+df_carregadores = pd.DataFrame(resumo_por_carregador())
+if df_carregadores.empty:
+    st.info("Nenhum carregador foi chamado ainda neste processo.")
+else:
+    st.dataframe(
+        df_carregadores.rename(columns={
+            'carregador': 'Carregador',
+            'chamadas': 'Chamadas',
+            'cache_local': 'Cache Local',
+            'cache_compartilhado': 'Cache Compartilhado',
+            'banco': 'Banco',
+            'taxa_de_acerto': 'Taxa de Acerto',
+            'p50_ms': 'P50 (ms)',
+            'p95_ms': 'P95 (ms)',
+            'p99_ms': 'P99 (ms)',
+            'p50_banco_ms': 'P50 Banco (ms)',
+            'p95_banco_ms': 'P95 Banco (ms)',
+            'execucao_total_ms': 'Execução Total (ms)',
+            'leitura_total_ms': 'Leitura Total (ms)',
+            'linhas_media': 'Linhas (Média)',
+            'bytes_ultimo_resultado': 'Bytes (Último)',
+        }).style.format({
+            'Taxa de Acerto': '{:.0%}',
+            'P50 (ms)': '{:.1f}', 'P95 (ms)': '{:.1f}', 'P99 (ms)': '{:.1f}',
+            'P50 Banco (ms)': '{:.1f}', 'P95 Banco (ms)': '{:.1f}',
+            'Execução Total (ms)': '{:.0f}', 'Leitura Total (ms)': '{:.0f}',
+            'Linhas (Média)': '{:.0f}', 'Bytes (Último)': '{:,.0f}',
+        }, na_rep='-'),
+        use_container_width=True,
+        hide_index=True
+    )
+
+# Últimos tempos de cada consulta preparada: PREPARE (round trip), execução e leitura medidos
+# no cliente; planejamento x execução no servidor vêm do EXPLAIN ANALYZE
+with st.expander("Tempos da última execução de cada consulta", expanded=False):
+    st.caption("prepare_ms: round trip do PREPARE · planejamento_ms / execucao_servidor_ms: EXPLAIN ANALYZE (consultas lentas ou botão abaixo).")
+    if st.button("Medir planejamento x execução (EXPLAIN ANALYZE com parâmetros de exemplo)"):
+        pool_diagnostico = conexao_banco_de_dados()
+        with st.spinner("Executando EXPLAIN ANALYZE das consultas..."), pool_diagnostico.conexao() as conn:
+            exemplo = parametros_de_exemplo(conn)
+            for nome, consulta in CONSULTAS.items():
+                # Só as consultas cujos parâmetros existem no exemplo (as demais precisam de valores da página)
+                if set(consulta.parametros) <= set(exemplo):
+                    try:
+                        medir_planejamento(conn, nome, **exemplo)
+                    except Exception as e:
+                        st.warning(f"{nome}: {e}")
+    if TEMPOS_DAS_CONSULTAS:
+        st.dataframe(pd.DataFrame(TEMPOS_DAS_CONSULTAS).T.round(1), use_container_width=True)
+    else:
+        st.info("Nenhuma consulta executada ainda neste processo.")
+
+st.markdown("---")
+
+# --- SESSÃO 2: CONSULTAS LENTAS ---
+st.header("Consultas Lentas")
+st.info("Consultas que passaram do limite configurado são executadas de novo com EXPLAIN (ANALYZE, BUFFERS). O plano fica salvo em JSON com os parâmetros usados.")
+
+capturas = capturas_recentes()
+if not capturas:
+    st.success("Nenhuma consulta lenta capturada neste processo.")
+for captura in capturas:
+    titulo = f"{captura['capturado_em']} · {captura['consulta']} · {captura['execucao_ms']:.0f} ms · {len(captura['alertas'])} alerta(s)"
+    with st.expander(titulo, expanded=False):
+        st.caption(
+            f"Planejamento: {captura.get('planejamento_ms') or 0:.1f} ms · Execução no servidor: {captura['execucao_explain_ms'] or 0:.1f} ms"
+            f" · Parâmetros: {captura['parametros']} · Arquivo: {captura['arquivo']}"
+        )
+        for alerta in captura['alertas']:
+            st.warning(alerta['detalhe'])
+        st.json(captura['plano'], expanded=False)
+
+st.markdown("---")
+
+# --- SESSÃO 3: POOL DE CONEXÕES ---
+st.header("Pool de Conexões")
+pool = conexao_banco_de_dados()
+if pool is None:
+    st.error("Pool de conexões indisponível. Verifique o PostgreSQL.")
+else:
+    metricas_pool = pool.metricas()
+    col_uso, col_checkouts, col_espera, col_problemas = st.columns(4)
+    col_uso.metric("Conexões em Uso", f"{metricas_pool['em_uso']} / {metricas_pool['maximo']}")
+    col_checkouts.metric("Checkouts", metricas_pool['checkouts'])
+    col_espera.metric("Espera P95", f"{metricas_pool['espera_p95_ms']:.1f} ms",
+                      help=f"Média {metricas_pool['espera_media_ms']:.1f} ms · Máx {metricas_pool['espera_max_ms']:.1f} ms")
+    col_problemas.metric("Timeouts / Reconexões", f"{metricas_pool['timeouts']} / {metricas_pool['reconexoes']}")
+
+st.markdown("---")
+
+# --- SESSÃO 4: CACHE (REVALIDAÇÃO E AQUECIMENTO) ---
+st.header("Cache")
+tab_revalidacao, tab_aquecimento, tab_compactacao = st.tabs(["Revalidação em Segundo Plano", "Aquecimento", "Tipos Compactos"])
+
+with tab_revalidacao:
+    df_revalidacao = pd.DataFrame(metricas_de_revalidacao())
+    if df_revalidacao.empty:
+        st.info("Nenhuma entrada de cache monitorada ainda.")
+    else:
+        df_revalidacao['atualizado_em'] = pd.to_datetime(df_revalidacao['atualizado_em'], unit='s')
+        st.dataframe(df_revalidacao, use_container_width=True, hide_index=True)
+
+with tab_aquecimento:
+    relatorio = aquecimento.ULTIMO_AQUECIMENTO
+    if relatorio is None:
+        st.info("O aquecimento ainda não terminou (ou está desativado) neste processo.")
+    else:
+        col_duracao, col_cobertura, col_lojas = st.columns(3)
+        col_duracao.metric("Duração", f"{relatorio['duracao_s']:.1f} s")
+        col_cobertura.metric("Cobertura", f"{relatorio['cobertura']:.0%}", help=f"{relatorio['concluidas']}/{relatorio['tarefas']} consultas")
+        col_lojas.metric("Lojas", relatorio['lojas'])
+        for descricao, erro in relatorio['falhas'].items():
+            st.warning(f"{descricao}: {erro}")
+
+with tab_compactacao:
+    st.caption("Memória dos resultados antes e depois da conversão para tipos compactos (categóricos, int8/int32, float32).")
+    df_compactacao = pd.DataFrame(relatorio_de_compactacao())
+    if df_compactacao.empty:
+        st.info("Nenhum resultado compactado ainda neste processo.")
+    else:
+        st.dataframe(
+            df_compactacao.style.format({
+                'bytes_antes': '{:,.0f}', 'bytes_depois': '{:,.0f}',
+                'ultima_entrada_antes': '{:,.0f}', 'ultima_entrada_depois': '{:,.0f}',
+                'reducao': '{:.0%}',
+            }),
+            use_container_width=True,
+            hide_index=True
+        )
+
+st.markdown("---")
+
+# --- SESSÃO 5: EXPORTAÇÃO ---
+with st.expander("Métricas no formato Prometheus", expanded=False):
+    st.caption("O mesmo texto é gravado periodicamente no arquivo configurado em [telemetria] arquivo_metricas.")
+    st.code(formatar_prometheus(pool.metricas() if pool is not None else None), language='text')
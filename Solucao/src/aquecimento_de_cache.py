@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Aquecimento do cache dos carregadores com os filtros padrão das páginas.
+
+O primeiro visitante depois de um deploy pagaria as dimensões e todas as consultas dos
+filtros padrão (loja de índice 0, últimos 6 meses, RFM de hoje). O aquecimento busca
+esses resultados para TODAS as lojas, em paralelo, antes de alguém pedir.
+
+Roda sozinho em segundo plano quando o app sobe (ver inicializador_global) ou pela linha
+de comando, na pasta `Solucao` (usa as credenciais de .streamlit/secrets.toml). Pela linha
+de comando, o efeito útil é popular o cache compartilhado usado pelas réplicas do app:
+
+    python -m src.aquecimento_de_cache --trabalhadores 8
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+
+import streamlit as st
+
+from .dimensoes import dimensoes
+from .carregamento_de_dados import (
+    carregar_cubo_produtos_loja, carregar_ticket_medio_canal_e_loja,
+    carregar_produtos_e_margem_rede, carregar_performance_temporal_rede, carregar_performance_por_regiao_rede,
+    carregar_limites_rfm, carregar_segmento_rfm, carregar_distribuicao_frequencia, carregar_segmentos_rfm,
+)
+from .organizacao_dos_dados import (
+    periodo_padrao, periodo_anterior, RECENCIA_PADRAO, FREQUENCIA_PADRAO, CLIENTES_POR_PAGINA,
+)
+
+TRABALHADORES_PADRAO = 4
+
+# Relatório do último aquecimento deste processo (None se ainda não rodou)
+ULTIMO_AQUECIMENTO = None
+
+
+# --- TAREFAS ---
+# As chamadas repetem EXATAMENTE a forma usada nas páginas (argumentos nomeados e os mesmos
+# tipos de valor), senão o st.cache_data gera outra chave e o aquecimento não serve de nada.
+# Dia da semana e faixa de horário (Quinta 19–23h, Sábado) não geram consultas: as páginas
+# recortam esses filtros em memória a partir do cubo e do resultado por dia/hora.
+
+def _segmento_rfm_padrao(hoje):
+    df_limites = carregar_limites_rfm(data_analise=hoje)
+    if df_limites.empty:
+        return
+    max_recency = max(int(df_limites['max_recency'].iloc[0]), 2)
+    max_frequency = max(int(df_limites['max_frequency'].iloc[0]), 2)
+    carregar_segmento_rfm(
+        data_analise=hoje,
+        recency_min=min(RECENCIA_PADRAO, max_recency),
+        frequency_min=min(FREQUENCIA_PADRAO, max_frequency),
+        limite=CLIENTES_POR_PAGINA,
+        offset=0
+    )
+
+
+def tarefas_padrao(ids_das_lojas, hoje=None):
+    """Lista de (descrição, função sem argumentos) com as consultas dos filtros padrão."""
+    hoje = hoje or date.today()
+    start_date, end_date = periodo_padrao(hoje)
+    inicio_anterior, fim_anterior = periodo_anterior(start_date, end_date)
+
+    tarefas = [
+        ("ticket_medio_canal_e_loja", lambda: carregar_ticket_medio_canal_e_loja(start_date=start_date, end_date=end_date)),
+        ("segmento_rfm", lambda: _segmento_rfm_padrao(hoje)),
+        ("distribuicao_frequencia", lambda: carregar_distribuicao_frequencia()),
+        ("segmentos_rfm", lambda: carregar_segmentos_rfm(data_analise=hoje)),
+        # Modo frota: uma consulta cobre todas as lojas
+        ("produtos_e_margem_rede", lambda: carregar_produtos_e_margem_rede()),
+        ("performance_temporal_rede", lambda: carregar_performance_temporal_rede(start_date=start_date, end_date=end_date)),
+        ("performance_temporal_rede_anterior", lambda: carregar_performance_temporal_rede(
+            start_date=inicio_anterior, end_date=fim_anterior)),
+        ("performance_por_regiao_rede", lambda: carregar_performance_por_regiao_rede(start_date=start_date, end_date=end_date)),
+    ]
+    # Mesma ordem e mesmo tipo de id dos selectbox: a loja de índice 0 é aquecida primeiro
+    for store_id in ids_das_lojas:
+        tarefas.append(
+            (f"cubo_produtos_loja[{store_id}]", lambda s=store_id: carregar_cubo_produtos_loja(store_id=s))
+        )
+    return tarefas
+
+
+# --- EXECUÇÃO ---
+
+def aquecer_cache(trabalhadores=TRABALHADORES_PADRAO):
+    """
+    Carrega as dimensões e executa as tarefas padrão de todas as lojas num pool limitado
+    de threads. Retorna o relatório: duração, lojas, tarefas concluídas, cobertura e falhas.
+    """
+    global ULTIMO_AQUECIMENTO
+    inicio = time.perf_counter()
+    ids_das_lojas = dimensoes().lojas.ids_ativos
+    tarefas = tarefas_padrao(ids_das_lojas)
+
+    falhas = {}
+    # Cada tarefa pega uma conexão do pool: mais trabalhadores que o pool só geraria espera
+    with ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix='aquecimento') as executor:
+        futuros = {executor.submit(funcao): descricao for descricao, funcao in tarefas}
+        for futuro in as_completed(futuros):
+            erro = futuro.exception()
+            if erro is not None:
+                falhas[futuros[futuro]] = str(erro)
+
+    ULTIMO_AQUECIMENTO = {
+        'duracao_s': time.perf_counter() - inicio,
+        'lojas': len(ids_das_lojas),
+        'tarefas': len(tarefas),
+        'concluidas': len(tarefas) - len(falhas),
+        'cobertura': (len(tarefas) - len(falhas)) / len(tarefas) if tarefas else 1.0,
+        'falhas': falhas,
+        'concluido_em': time.time(),
+    }
+    return ULTIMO_AQUECIMENTO
+
+
+def _aquecer_em_segundo_plano(trabalhadores):
+    try:
+        aquecer_cache(trabalhadores)
+    except Exception as e:
+        # O app continua funcionando sem o aquecimento (as páginas só ficam mais lentas)
+        print(f"✗ Falha no aquecimento do cache: {e}")
+
+
+@st.cache_resource(show_spinner=False)
+def iniciar_aquecimento():
+    """
+    Dispara o aquecimento numa thread, uma única vez por processo.
+    Configurável em .streamlit/secrets.toml ([aquecimento] ativo = true, trabalhadores = 4).
+    """
+    config = st.secrets.get("aquecimento", {})
+    if not config.get("ativo", True):
+        return None
+    thread = threading.Thread(
+        target=_aquecer_em_segundo_plano,
+        args=(config.get("trabalhadores", TRABALHADORES_PADRAO),),
+        name='aquecimento-cache',
+        daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aquece o cache dos carregadores com os filtros padrão das páginas')
+    parser.add_argument('--trabalhadores', type=int, default=TRABALHADORES_PADRAO,
+                        help='Número de consultas simultâneas (não passe do pool_max)')
+    args = parser.parse_args()
+
+    relatorio = aquecer_cache(args.trabalhadores)
+    print(f"✓ Aquecimento em {relatorio['duracao_s']:.1f}s: {relatorio['concluidas']}/{relatorio['tarefas']} "
+          f"consultas de {relatorio['lojas']} lojas (cobertura {relatorio['cobertura']:.0%})")
+    for descricao, erro in relatorio['falhas'].items():
+        print(f"✗ {descricao}: {erro}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+import functools
+import hashlib
+import inspect
+import io
+import json
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from .consultas import CONSULTAS
+from .telemetria import anotar_origem
+from .tipos_compactos import ESQUEMA_COMPACTO
+
+
+# --- CACHE COMPARTILHADO ENTRE PROCESSOS ---
+# O st.cache_data vive dentro de um processo. Com várias réplicas do app, cada uma repetiria
+# as mesmas queries. Este cache fica ABAIXO do st.cache_data: num miss local, a réplica
+# procura o resultado no backend compartilhado antes de ir ao banco.
+# Chave = nome do carregador + parâmetros normalizados + versão do código do carregador
+# (código-fonte dele e das funções/classes/constantes do projeto que ele usa, SQL das
+# consultas registradas e esquema de tipos compactos) (+ versão dos dados). Valor = DataFrames em Arrow IPC (colunar, comprimido).
+
+# Limpeza do backend em disco: como a versão dos dados entra na chave, cada mudança em `sales`
+# gera um novo conjunto de arquivos. Arquivos sem uso há mais de `dias` são apagados, e os
+# menos usados saem primeiro quando o diretório passa de `max_mb`.
+DIAS_SEM_USO_PADRAO = 7
+TAMANHO_MAXIMO_MB_PADRAO = 1024
+INTERVALO_DA_LIMPEZA = 5 * 60
+
+
+class BackendEmDisco:
+    """Armazena cada resultado num arquivo do diretório (funciona para réplicas no mesmo host)."""
+
+    def __init__(self, diretorio, dias_sem_uso=DIAS_SEM_USO_PADRAO, tamanho_maximo_mb=TAMANHO_MAXIMO_MB_PADRAO):
+        self.diretorio = diretorio
+        self.dias_sem_uso = dias_sem_uso
+        self.tamanho_maximo = tamanho_maximo_mb * 1024 ** 2
+        self._trava = threading.Lock()
+        self._ultima_limpeza = 0.0
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, chave[:2], f"{chave}.arrow")
+
+    def ler(self, chave):
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, 'rb') as arquivo:
+                dados = arquivo.read()
+        except FileNotFoundError:
+            return None
+        try:
+            # mtime = último uso: a limpeza apaga primeiro o que ninguém lê
+            os.utime(caminho)
+        except OSError:
+            pass
+        return dados
+
+    def gravar(self, chave, dados):
+        caminho = self._caminho(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        # Escrita atômica: outro processo nunca lê um arquivo pela metade
+        descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix='.tmp')
+        with os.fdopen(descritor, 'wb') as arquivo:
+            arquivo.write(dados)
+        os.replace(temporario, caminho)
+        self._agendar_limpeza()
+
+    def _agendar_limpeza(self):
+        with self._trava:
+            if time.time() - self._ultima_limpeza < INTERVALO_DA_LIMPEZA:
+                return
+            self._ultima_limpeza = time.time()
+        threading.Thread(target=self.limpar, name='limpeza-cache-compartilhado', daemon=True).start()
+
+    def limpar(self):
+        """Apaga arquivos sem uso há mais de `dias_sem_uso` e, acima do tamanho máximo, os menos usados."""
+        limite_de_uso = time.time() - self.dias_sem_uso * 24 * 3600
+        arquivos = []
+        for raiz, _, nomes in os.walk(self.diretorio):
+            for nome in nomes:
+                caminho = os.path.join(raiz, nome)
+                try:
+                    info = os.stat(caminho)
+                except OSError:
+                    continue  # Apagado por outra réplica
+                arquivos.append((info.st_mtime, info.st_size, caminho))
+
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        apagados = 0
+        for uso, tamanho, caminho in sorted(arquivos):
+            if uso >= limite_de_uso and total <= self.tamanho_maximo:
+                break
+            if caminho.endswith('.tmp') and uso >= limite_de_uso:
+                continue  # Escrita em andamento de outro processo
+            try:
+                os.remove(caminho)
+                apagados += 1
+            except OSError:
+                pass
+            total -= tamanho
+        return apagados
+
+
+class BackendEmMemoria:
+    """
+    Backend local em memória com a mesma interface (ler/gravar bytes por chave).
+    Substituto para um backend de rede (ex: Redis) em desenvolvimento e testes.
+    """
+
+    def __init__(self):
+        self._dados = {}
+        self._trava = threading.Lock()
+
+    def ler(self, chave):
+        with self._trava:
+            return self._dados.get(chave)
+
+    def gravar(self, chave, dados):
+        with self._trava:
+            self._dados[chave] = dados
+
+
+BACKENDS = {
+    'disco': lambda config: BackendEmDisco(
+        config.get('diretorio', os.path.join('.cache', 'carregadores')),
+        dias_sem_uso=config.get('dias_sem_uso', DIAS_SEM_USO_PADRAO),
+        tamanho_maximo_mb=config.get('max_mb', TAMANHO_MAXIMO_MB_PADRAO),
+    ),
+    'memoria': lambda config: BackendEmMemoria(),
+}
+
+
+@st.cache_resource
+def obter_backend():
+    """Backend configurado em .streamlit/secrets.toml ([cache_compartilhado] backend = "disco" | "memoria")."""
+    config = st.secrets.get("cache_compartilhado", {})
+    return BACKENDS[config.get("backend", "disco")](config)
+
+
+# --- SERIALIZAÇÃO ---
+# Formato: [tamanho do cabeçalho][cabeçalho JSON][blocos Arrow IPC dos DataFrames/tabelas]
+# O cabeçalho descreve as partes (DataFrame, tabela Arrow ou valor simples) para reconstruir
+# tuplas como (df_canal, df_loja, df_geral) ou (tabela_pagina, total).
+# Tabelas Arrow são gravadas e lidas sem passar pelo pandas.
+
+def serializar(resultado, criado_em=None):
+    partes = resultado if isinstance(resultado, tuple) else (resultado,)
+    cabecalho = {'tupla': isinstance(resultado, tuple), 'criado_em': criado_em or time.time(), 'partes': []}
+    blocos = []
+    for parte in partes:
+        if isinstance(parte, pd.DataFrame):
+            buffer = io.BytesIO()
+            parte.reset_index(drop=True).to_feather(buffer, compression='zstd')
+            blocos.append(buffer.getvalue())
+            cabecalho['partes'].append({'tipo': 'df', 'tamanho': len(blocos[-1])})
+        elif isinstance(parte, pa.Table):
+            sink = pa.BufferOutputStream()
+            opcoes = pa.ipc.IpcWriteOptions(compression='zstd')
+            with pa.ipc.new_stream(sink, parte.schema, options=opcoes) as escritor:
+                escritor.write_table(parte)
+            blocos.append(sink.getvalue().to_pybytes())
+            cabecalho['partes'].append({'tipo': 'arrow', 'tamanho': len(blocos[-1])})
+        else:
+            cabecalho['partes'].append({'tipo': 'valor', 'valor': _normalizar(parte)})
+    cabecalho = json.dumps(cabecalho).encode('utf-8')
+    return struct.pack('<I', len(cabecalho)) + cabecalho + b''.join(blocos)
+
+
+def desserializar(dados):
+    """Retorna (resultado, criado_em)."""
+    (tamanho,) = struct.unpack_from('<I', dados)
+    cabecalho = json.loads(dados[4:4 + tamanho].decode('utf-8'))
+    posicao = 4 + tamanho
+    partes = []
+    for parte in cabecalho['partes']:
+        if parte['tipo'] == 'df':
+            partes.append(pd.read_feather(io.BytesIO(dados[posicao:posicao + parte['tamanho']])))
+            posicao += parte['tamanho']
+        elif parte['tipo'] == 'arrow':
+            partes.append(pa.ipc.open_stream(pa.py_buffer(dados[posicao:posicao + parte['tamanho']])).read_all())
+            posicao += parte['tamanho']
+        else:
+            partes.append(parte['valor'])
+    resultado = tuple(partes) if cabecalho['tupla'] else partes[0]
+    return resultado, cabecalho['criado_em']
+
+
+# --- CHAVE DO CARREGADOR ---
+
+def _normalizar(valor):
+    """Deixa os parâmetros com a mesma representação em qualquer processo (numpy, datas, tuplas)."""
+    if hasattr(valor, 'item') and not isinstance(valor, (list, tuple, dict)):
+        valor = valor.item()  # numpy.int64 -> int, etc.
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, (list, tuple)):
+        return [_normalizar(v) for v in valor]
+    if isinstance(valor, dict):
+        return {str(k): _normalizar(v) for k, v in valor.items()}
+    return valor
+
+
+def _consultas_do_carregador(codigo):
+    """Nomes das consultas registradas citados no código do carregador (ex: executar_consulta(conn, "top_produtos"))."""
+    return sorted({nome for nome in re.findall(r"[\"']([A-Za-z_][A-Za-z0-9_]*)[\"']", codigo) if nome in CONSULTAS})
+
+
+_PACOTE = __name__.rpartition('.')[0]
+_CONSTANTES = (int, float, str, bytes, bool, tuple, frozenset)
+
+
+def _codigos(objeto):
+    """Code objects de uma função (com as funções internas) ou de todos os métodos de uma classe."""
+    if inspect.isclass(objeto):
+        membros = [m.__func__ if isinstance(m, (staticmethod, classmethod)) else m for m in vars(objeto).values()]
+        pendentes = [inspect.unwrap(m).__code__ for m in membros if inspect.isfunction(inspect.unwrap(m))]
+    else:
+        pendentes = [objeto.__code__]
+    while pendentes:
+        codigo = pendentes.pop()
+        yield codigo
+        pendentes += [c for c in codigo.co_consts if inspect.iscode(c)]
+
+
+def _dependencias(funcao):
+    """
+    Código-fonte do carregador e, transitivamente, das funções e classes do projeto que ele usa
+    (ex: _margem_por_produto, resumir_histograma_entregas, decodificar), mais o valor das
+    constantes simples do projeto que ele cita (ex: LARGURA_BUCKET_ENTREGA_SEGUNDOS).
+    """
+    partes = {}
+    pendentes = [inspect.unwrap(funcao)]
+    vistos = set()
+    while pendentes:
+        objeto = pendentes.pop()
+        if id(objeto) in vistos:
+            continue
+        vistos.add(id(objeto))
+        try:
+            partes[f"{objeto.__module__}.{objeto.__qualname__}"] = inspect.getsource(objeto)
+        except (OSError, TypeError):
+            # Sem fonte disponível (ex: criada dinamicamente): entra só o nome
+            partes[f"{objeto.__module__}.{objeto.__qualname__}"] = ''
+        modulo = inspect.getmodule(objeto)
+        for codigo in _codigos(objeto):
+            for nome in codigo.co_names:
+                valor = getattr(modulo, nome, None)
+                if isinstance(valor, _CONSTANTES) and nome.isupper():
+                    partes[f"{modulo.__name__}.{nome}"] = repr(valor)
+                    continue
+                valor = inspect.unwrap(valor) if callable(valor) else valor
+                if (inspect.isfunction(valor) or inspect.isclass(valor)) and \
+                        getattr(valor, '__module__', '').startswith(_PACOTE + '.'):
+                    pendentes.append(valor)
+    return [f"{nome}:{partes[nome]}" for nome in sorted(partes)]
+
+
+@functools.lru_cache(maxsize=None)
+def _versao_do_codigo(funcao):
+    """
+    Hash do código-fonte do carregador e das funções do projeto que ele chama, do SQL das
+    consultas registradas que ele executa e do esquema de tipos compactos: mudar qualquer
+    um deles invalida os resultados antigos.
+    (Calculado na primeira chamada, quando as consultas do módulo já foram registradas.)
+    """
+    partes = _dependencias(funcao)
+    codigo = "\n".join(partes)
+    partes += [f"{nome}:{CONSULTAS[nome].sql}" for nome in _consultas_do_carregador(codigo)]
+    partes.append(json.dumps(ESQUEMA_COMPACTO, sort_keys=True))
+    return hashlib.sha256("\n".join(partes).encode('utf-8')).hexdigest()[:16]
+
+
+def chave_do_carregador(funcao, args, kwargs, versao_dados=''):
+    """Hash de: nome do carregador + parâmetros nomeados normalizados + versão do código + versão dos dados."""
+    assinatura = inspect.signature(funcao).bind(*args, **kwargs)
+    assinatura.apply_defaults()
+    parametros = json.dumps(_normalizar(dict(assinatura.arguments)), sort_keys=True, default=str)
+    bruto = f"{funcao.__module__}.{funcao.__qualname__}|{parametros}|{_versao_do_codigo(funcao)}|{versao_dados}"
+    return hashlib.sha256(bruto.encode('utf-8')).hexdigest()
+
+
+def cache_compartilhado(ttl=None, versao=None):
+    """
+    Decorator para carregadores `carregar_*` (aplicado abaixo do cache local).
+    Num miss local, procura o resultado no backend compartilhado; se não houver (ou tiver
+    mais de `ttl` segundos), executa o carregador e publica o resultado para as outras réplicas.
+    `versao` é uma função sem argumentos que devolve a versão atual dos dados (entra na chave).
+    Falhas no backend nunca quebram o carregador: ele apenas segue para o banco.
+    """
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def carregador(*args, **kwargs):
+            backend = chave = None
+            try:
+                backend = obter_backend()
+                chave = chave_do_carregador(funcao, args, kwargs, versao() if versao else '')
+                dados = backend.ler(chave)
+                if dados is not None:
+                    inicio = time.perf_counter()
+                    resultado, criado_em = desserializar(dados)
+                    if ttl is None or time.time() - criado_em <= ttl:
+                        anotar_origem('cache_compartilhado', 1000 * (time.perf_counter() - inicio))
+                        return resultado
+            except Exception:
+                pass
+
+            anotar_origem('banco')
+            resultado = funcao(*args, **kwargs)
+
+            if chave is not None:
+                try:
+                    backend.gravar(chave, serializar(resultado))
+                except Exception:
+                    pass
+            return resultado
+        return carregador
+    return decorador
@@ -1,218 +1,618 @@
 import streamlit as st
 import psycopg2
 import pandas as pd
+import pyarrow as pa
+from .pool_de_conexoes import PoolDeConexoes
+from .consultas import registrar_consulta, executar_consulta, iterar_consulta, ler_consulta_em_blocos, ler_consulta_arrow
+from .versao_dos_dados import cache_versionado, versao_das_tabelas
+from .dimensoes import dimensoes, decodificar
+from .organizacao_dos_dados import DIAS_DA_SEMANA_SQL, resumir_histograma_entregas
+from .tabelas_agregadas import LARGURA_BUCKET_ENTREGA_SEGUNDOS, atualizar_resumo_clientes
 
-# Função para inicializar a conexão com o docker
+# Função para inicializar o pool de conexões com o docker
 @st.cache_resource
 def conexao_banco_de_dados():
-    """Initializes and returns the database connection object."""
+    """Initializes and returns the process-wide connection pool (shared by all sessions)."""
+    config = st.secrets["connections"]["postgres"]
     try:
-        return psycopg2.connect(
-            host=st.secrets["connections"]["postgres"]["host"],
-            database=st.secrets["connections"]["postgres"]["database"],
-            user=st.secrets["connections"]["postgres"]["user"],
-            password=st.secrets["connections"]["postgres"]["password"],
-            port=st.secrets["connections"]["postgres"]["port"]
+        return PoolDeConexoes(
+            minimo=config.get("pool_min", 2),
+            maximo=config.get("pool_max", 10),
+            host=config["host"],
+            database=config["database"],
+            user=config["user"],
+            password=config["password"],
+            port=config["port"]
         )
     except Exception as e:
         st.error(f"Não foi possível conectar ao Postgres. Verifique o Docker e o Host. Error: {e}")
         st.stop()
         return None
 
-#Carregamento de Metadados
-@st.cache_data(ttl=60 * 60 * 24) # Cache longo para dados estáticos
-def carregar_metadados():
-    """Carrega dados estáticos (Lojas e Canais) e retorna dois DataFrames."""
-    conn = conexao_banco_de_dados()
-    if conn is None:
-        # Retornanando a mesma quantidade de objetos que serão desempacotados (IMPORTANTE)!
-        return pd.DataFrame(), pd.DataFrame() 
-    
-    try:
-        # Carrega a lista de lojas
-        df_stores = pd.read_sql("SELECT id, name FROM stores WHERE is_active = TRUE;", conn)
-        # Carrega a lista de canais
-        df_channels = pd.read_sql("SELECT id, name FROM channels;", conn)
-        
-        # Retorna os dois DataFrames para desempacotá-los
-        return df_stores, df_channels
-    except Exception as e:
-        st.error(f"Erro ao carregar metadados (Lojas/Canais): {e}")
-        return pd.DataFrame(), pd.DataFrame()
+# Metadados (lojas, canais, produtos...): ver src/dimensoes.py. As consultas abaixo devolvem
+# só os ids das dimensões; os nomes são decodificados em memória, sem JOIN.
 
 # --- 1. Top Produtos por Filtro (DOR: "Qual produto vende mais...?") ---
-@st.cache_data(ttl=360) 
+# Lê do cubo pré-agregado agg_vendas_produto_hora (ver src/tabelas_agregadas.py):
+# poucos milhares de linhas por loja em vez de milhões de itens vendidos.
+# O ranking (top 10) é feito depois de decodificar: produtos com o mesmo nome somam juntos.
+registrar_consulta("top_produtos", """
+    SELECT 
+        r.product_id, 
+        SUM(r.total_quantity) AS total_vendido
+    FROM agg_vendas_produto_hora r
+    WHERE r.channel_id = $1::int
+      AND r.store_id = $2::int
+      AND r.day_of_week = $3::int
+      AND r.hour_of_day BETWEEN $4::int AND $5::int
+    GROUP BY r.product_id;
+""", parametros=("channel_id", "store_id", "day_sql", "hour_min", "hour_max"))
+
+@cache_versionado('agg_vendas_produto_hora', 'products', 'channels')
 def carregar_top_produtos(store_id, channel_name, day_of_week, hour_min, hour_max):
-    conn = conexao_banco_de_dados()
-    if conn is None: return pd.DataFrame()
-    day_map = {"Segunda": 1, "Terça": 2, "Quarta": 3, "Quinta": 4, "Sexta": 5, "Sábado": 6, "Domingo": 0}
-    day_sql = day_map.get(day_of_week)
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame()
+    day_sql = DIAS_DA_SEMANA_SQL.get(day_of_week)
+    dims = dimensoes()
+    channel_id = dims.canais.id_por_nome(channel_name)
+    if channel_id is None:
+        return pd.DataFrame({'product_name': pd.Series(dtype=object), 'total_vendido': pd.Series(dtype=float)})
 
-    query = f"""
-    SELECT 
-        p.name AS product_name, 
-        SUM(ps.quantity) AS total_vendido
-    FROM sales s
-    JOIN product_sales ps ON ps.sale_id = s.id
-    JOIN products p ON p.id = ps.product_id
-    JOIN channels c ON c.id = s.channel_id
-    WHERE s.sale_status_desc = 'COMPLETED'
-      AND c.name = '{channel_name}'
-      AND s.store_id = {store_id}
-      AND EXTRACT(DOW FROM s.created_at) = {day_sql}
-      AND EXTRACT(HOUR FROM s.created_at) BETWEEN {hour_min} AND {hour_max}
-    GROUP BY p.name
-    ORDER BY total_vendido DESC
-    LIMIT 10;
-    """
-    return pd.read_sql(query, conn)
+    with pool.conexao() as conn:
+        df = executar_consulta(
+            conn, "top_produtos",
+            channel_id=channel_id, store_id=int(store_id), day_sql=day_sql,
+            hour_min=int(hour_min), hour_max=int(hour_max)
+        )
+    df = decodificar(df, 'product_id', dims.produtos, 'product_name')
+    return (
+        df.groupby('product_name', observed=True, as_index=False)['total_vendido'].sum()
+        .nlargest(10, 'total_vendido')
+        .reset_index(drop=True)
+    )
 
-# --- 2. Ticket Médio por Canal e Loja (DOR: "Ticket médio está caindo...") ---
-@st.cache_data(ttl=360)
-def carregar_ticket_medio_por_canal(start_date, end_date):
-    conn = conexao_banco_de_dados()
-    if conn is None: return pd.DataFrame()
+# --- 1.1 Cubo de Produtos da Loja (ranking filtrado em memória) ---
+# Traz o cubo inteiro da loja (canal x dia x hora x produto) UMA vez por loja e janela de cache.
+# Os filtros de canal, dia e horário da página são resolvidos em memória por
+# organizacao_dos_dados.top_produtos_do_cubo, sem nova ida ao banco.
+registrar_consulta("cubo_produtos_loja", """
+    SELECT
+        r.channel_id,
+        r.day_of_week,
+        r.hour_of_day,
+        r.product_id,
+        r.total_quantity
+    FROM agg_vendas_produto_hora r
+    WHERE r.store_id = $1::int;
+""", parametros=("store_id",))
+
+@cache_versionado('agg_vendas_produto_hora', 'products', 'channels')
+def carregar_cubo_produtos_loja(store_id):
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame()
 
-    query = f"""
+    with pool.conexao() as conn:
+        df = executar_consulta(conn, "cubo_produtos_loja", store_id=int(store_id))
+    # Categóricos e inteiros pequenos: o fatiamento vira comparação de códigos em arrays NumPy
+    dims = dimensoes()
+    df = decodificar(df, 'channel_id', dims.canais, 'channel_name')
+    df = decodificar(df, 'product_id', dims.produtos, 'product_name')
+    return df.astype({
+        'day_of_week': 'int8',
+        'hour_of_day': 'int8',
+        'total_quantity': 'float64'
+    })
+
+# --- 2. Ticket Médio por Canal e Loja (DOR: "Ticket médio está caindo...") ---
+registrar_consulta("ticket_medio_por_canal", """
     SELECT 
         DATE_TRUNC('day', s.created_at) AS sale_date,
-        c.name AS channel_name,
+        s.channel_id,
         AVG(s.total_amount) AS avg_ticket
     FROM sales s
-    JOIN channels c ON c.id = s.channel_id
     WHERE s.sale_status_desc = 'COMPLETED'
-      AND s.created_at BETWEEN '{start_date}' AND '{end_date}'
+      AND s.created_at BETWEEN $1::timestamp AND $2::timestamp
     GROUP BY 1, 2
     ORDER BY 1;
-    """
-    return pd.read_sql(query, conn)
+""", parametros=("start_date", "end_date"))
 
-@st.cache_data(ttl=360)
-def carregar_ticket_medio_por_loja(start_date, end_date):
-    conn = conexao_banco_de_dados()
-    if conn is None: return pd.DataFrame()
+@cache_versionado('sales', 'channels')
+def carregar_ticket_medio_por_canal(start_date, end_date):
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame()
+
+    with pool.conexao() as conn:
+        df = executar_consulta(conn, "ticket_medio_por_canal", start_date=start_date, end_date=end_date)
+    return decodificar(df, 'channel_id', dimensoes().canais, 'channel_name')
 
-    query = f"""
+registrar_consulta("ticket_medio_por_loja", """
     SELECT 
         DATE_TRUNC('day', s.created_at) AS sale_date,
-        st.name AS store_name,
+        s.store_id,
         AVG(s.total_amount) AS avg_ticket
     FROM sales s
-    JOIN stores st ON st.id = s.store_id
     WHERE s.sale_status_desc = 'COMPLETED'
-      AND s.created_at BETWEEN '{start_date}' AND '{end_date}'
+      AND s.created_at BETWEEN $1::timestamp AND $2::timestamp
     GROUP BY 1, 2
     ORDER BY 1;
+""", parametros=("start_date", "end_date"))
+
+@cache_versionado('sales', 'stores')
+def carregar_ticket_medio_por_loja(start_date, end_date):
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame()
+
+    with pool.conexao() as conn:
+        df = executar_consulta(conn, "ticket_medio_por_loja", start_date=start_date, end_date=end_date)
+    return decodificar(df, 'store_id', dimensoes().lojas, 'store_name')
+
+# --- 2.1 Ticket Médio por Canal, por Loja e Geral em UMA varredura (GROUPING SETS) ---
+# GROUPING(channel_id, store_id): 1 = dia x canal, 2 = dia x loja, 3 = total do dia
+registrar_consulta("ticket_medio_canal_e_loja", """
+    WITH vendas AS (
+        SELECT 
+            DATE_TRUNC('day', s.created_at) AS sale_date,
+            s.channel_id,
+            s.store_id,
+            s.total_amount
+        FROM sales s
+        WHERE s.sale_status_desc = 'COMPLETED'
+          AND s.created_at BETWEEN $1::timestamp AND $2::timestamp
+    )
+    SELECT
+        sale_date,
+        channel_id,
+        store_id,
+        GROUPING(channel_id, store_id) AS nivel,
+        SUM(total_amount) AS sum_amount,
+        COUNT(*) AS sale_count
+    FROM vendas
+    GROUP BY GROUPING SETS ((sale_date, channel_id), (sale_date, store_id), (sale_date))
+    ORDER BY sale_date;
+""", parametros=("start_date", "end_date"))
+
+@cache_versionado('sales', 'channels', 'stores')
+def carregar_ticket_medio_canal_e_loja(start_date, end_date):
     """
-    return pd.read_sql(query, conn)
+    Retorna três DataFrames de uma única query/entrada de cache:
+    (por canal: sale_date, channel_name, ...), (por loja: sale_date, store_name, ...)
+    e (geral: sale_date, ...).
+
+    Cada linha traz as parciais somáveis sum_amount e sale_count (além do avg_ticket do dia),
+    então qualquer visão mais grossa (período, semana, canal) é re-agregada de forma exata
+    com organizacao_dos_dados.reagregar_ticket, sem nova query.
+    """
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
+    with pool.conexao() as conn:
+        df = executar_consulta(conn, "ticket_medio_canal_e_loja", start_date=start_date, end_date=end_date)
+    df['avg_ticket'] = df['sum_amount'] / df['sale_count']
+
+    parciais = ['sum_amount', 'sale_count', 'avg_ticket']
+    dims = dimensoes()
+    df_canal = df[df['nivel'] == 1][['sale_date', 'channel_id'] + parciais].reset_index(drop=True)
+    df_canal = decodificar(df_canal, 'channel_id', dims.canais, 'channel_name')
+    df_loja = df[df['nivel'] == 2][['sale_date', 'store_id'] + parciais].reset_index(drop=True)
+    df_loja = decodificar(df_loja, 'store_id', dims.lojas, 'store_name')
+    df_geral = df[df['nivel'] == 3][['sale_date'] + parciais].reset_index(drop=True)
+    return df_canal, df_loja, df_geral
 
 # --- 3. Produtos e Margem (DOR: "Produtos com menor margem...") ---
-@st.cache_data(ttl=360)
-def carregar_produtos_e_margem(store_id):
-    conn = conexao_banco_de_dados()
-    if conn is None: return pd.DataFrame()
-
-    # Simplificação: Usamos a diferença entre preço total e custo base como proxy para margem, 
-    # ou uma agregação que traga base_price e total_price.
-    # SQL aqui é um pouco mais complexo devido ao JOIN de item_product_sales.
-    query = f"""
-    -- Traz o preço médio de venda e o custo/base price (proxy)
+# Simplificação: Usamos a diferença entre preço total e custo base como proxy para margem, 
+# ou uma agregação que traga base_price e total_price.
+# SQL aqui é um pouco mais complexo devido ao JOIN de item_product_sales.
+# Agrupa por product_id e devolve somas + contagens: as médias (e o filtro de relevância)
+# são calculadas depois de decodificar, somando produtos de mesmo nome como o GROUP BY p.name fazia.
+registrar_consulta("produtos_e_margem", """
+    -- Traz as parciais do preço médio de venda e do custo/base price (proxy)
     SELECT 
-        p.name AS product_name,
-        AVG(ps.total_price / ps.quantity) AS avg_sale_price,
-        AVG(ps.base_price) AS avg_base_price,
+        ps.product_id,
+        SUM(ps.total_price / ps.quantity) AS sum_sale_price,
+        COUNT(ps.total_price / ps.quantity) AS count_sale_price,
+        SUM(ps.base_price) AS sum_base_price,
+        COUNT(ps.base_price) AS count_base_price,
         SUM(ps.quantity) AS total_quantity_sold
     FROM product_sales ps
     JOIN sales s ON s.id = ps.sale_id
-    JOIN products p ON p.id = ps.product_id
-    WHERE s.store_id = {store_id} 
+    WHERE s.store_id = $1::int 
       AND s.sale_status_desc = 'COMPLETED'
-    GROUP BY p.name
-    HAVING SUM(ps.quantity) > 50 -- Filtra produtos pouco vendidos para relevância
-    ;
-    """
-    df = pd.read_sql(query, conn)
+    GROUP BY ps.product_id;
+""", parametros=("store_id",))
+
+def _margem_por_produto(df, por=()):
+    """Parciais por product_id -> avg_sale_price, avg_base_price e margem estimada por nome de produto (e por `por`)."""
+    chaves = list(por) + ['product_name']
+    df = decodificar(df, 'product_id', dimensoes().produtos, 'product_name')
+    df = df.groupby(chaves, observed=True, as_index=False).sum()
+    # Filtra produtos pouco vendidos para relevância
+    df = df[df['total_quantity_sold'] > 50]
+    df = pd.DataFrame({
+        **{chave: df[chave] for chave in chaves},
+        'avg_sale_price': df['sum_sale_price'] / df['count_sale_price'],
+        'avg_base_price': df['sum_base_price'] / df['count_base_price'],
+        'total_quantity_sold': df['total_quantity_sold'],
+    })
     # Cálculo da Margem (Estimada) no Pandas, após carregar o resultado AGREGADO do SQL.
     df['estimated_margin'] = (df['avg_sale_price'] - df['avg_base_price']) / df['avg_sale_price']
     df['estimated_margin_percent'] = df['estimated_margin'] * 100
-    return df.sort_values(by='estimated_margin_percent', ascending=True)
+    return df.sort_values(by=list(por) + ['estimated_margin_percent']).reset_index(drop=True)
+
+@cache_versionado('sales', 'product_sales', 'products')
+def carregar_produtos_e_margem(store_id):
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame()
+
+    with pool.conexao() as conn:
+        df = executar_consulta(conn, "produtos_e_margem", store_id=int(store_id))
+    return _margem_por_produto(df)
 
 # --- 4. Performance Temporal de Entrega ---
-@st.cache_data(ttl=360) 
-def carregar_performance_temporal(store_id):
-  conn = conexao_banco_de_dados()
-  if conn is None: return pd.DataFrame()
-  
-  # EXTRACT(DOW) para agrupar por Dia da Semana (0=Domingo, 6=Sábado)
-  query = f"""
+# Lê o histograma pré-agregado de delivery_seconds (buckets de 1 minuto) por dia e hora
+# (ver src/tabelas_agregadas.py), apenas para os dias da janela [start_date, end_date].
+# Média exata; P50/P90/P99 com erro máximo de 1 minuto. O custo é limitado pela janela,
+# e comparar dois períodos (ex: este mês x mês anterior) são duas leituras pequenas no rollup.
+registrar_consulta("performance_temporal", """
   SELECT
-    EXTRACT(DOW FROM s.created_at) AS day_of_week_num, -- Novo: Dia da Semana (0-6)
-    EXTRACT(HOUR FROM s.created_at) AS hour_of_day,
-    AVG(s.delivery_seconds / 60.0) AS avg_delivery_minutes,
-    PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY s.delivery_seconds / 60.0) AS p90_delivery_minutes
-  FROM sales s
-  WHERE s.store_id = {store_id}
-   AND s.delivery_seconds IS NOT NULL -- Apenas vendas com entrega
-   AND s.sale_status_desc = 'COMPLETED'
-  GROUP BY 1, 2 -- Agrupamos por Dia E Hora
-  ORDER BY 1, 2;
-  """
-  return pd.read_sql(query, conn)
+    day_of_week AS day_of_week_num, -- Dia da Semana (0=Domingo, 6=Sábado)
+    hour_of_day,
+    bucket,
+    SUM(deliveries) AS deliveries,
+    SUM(sum_seconds) AS sum_seconds
+  FROM agg_entregas_hora_hist
+  WHERE store_id = $1::int
+    AND sale_date BETWEEN $2::date AND $3::date
+  GROUP BY 1, 2, 3;
+""", parametros=("store_id", "start_date", "end_date"))
+
+@cache_versionado('agg_entregas_hora_hist')
+def carregar_performance_temporal(store_id, start_date, end_date):
+  pool = conexao_banco_de_dados()
+  if pool is None: return pd.DataFrame()
+  
+  with pool.conexao() as conn:
+    df = executar_consulta(
+      conn, "performance_temporal", store_id=int(store_id), start_date=start_date, end_date=end_date
+    )
+  # Agrupamos por Dia E Hora
+  return resumir_histograma_entregas(df, ['day_of_week_num', 'hour_of_day'], LARGURA_BUCKET_ENTREGA_SEGUNDOS)
 
 # --- 5. Análise Geográfica de Entrega (DOR: "Tempo de entrega por região?") ---
-@st.cache_data(ttl=360) 
-def carregar_performance_por_regiao(store_id):
-    conn = conexao_banco_de_dados()
-    if conn is None: return pd.DataFrame()
+registrar_consulta("performance_por_regiao", """
+    SELECT 
+        neighborhood,
+        bucket,
+        SUM(deliveries) AS deliveries,
+        SUM(sum_seconds) AS sum_seconds
+    FROM agg_entregas_bairro_hist
+    WHERE store_id = $1::int
+      AND sale_date BETWEEN $2::date AND $3::date
+    GROUP BY 1, 2;
+""", parametros=("store_id", "start_date", "end_date"))
+
+@cache_versionado('agg_entregas_bairro_hist')
+def carregar_performance_por_regiao(store_id, start_date, end_date):
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame()
+
+    with pool.conexao() as conn:
+        df = executar_consulta(
+            conn, "performance_por_regiao", store_id=int(store_id), start_date=start_date, end_date=end_date
+        )
+    df = resumir_histograma_entregas(df, ['neighborhood'], LARGURA_BUCKET_ENTREGA_SEGUNDOS)
+    # Garante que a amostra é relevante
+    df = df[df['total_deliveries'] >= 10]
+    return df.sort_values(by='avg_delivery_minutes', ascending=False).reset_index(drop=True)
 
-    query = f"""
+# --- 5.1 Modo Frota: todas as lojas em UMA varredura agrupada por loja ---
+# Os carregadores 3, 4 e 5 acima são chaveados por store_id: folhear 50 lojas no selectbox são
+# 50 consultas. As variantes abaixo calculam a rede inteira numa consulta agrupada por store_id
+# e devolvem o resultado ordenado por loja; a página recorta a loja escolhida em memória com
+# organizacao_dos_dados.particao_da_loja (busca binária no store_id), sem nova ida ao banco.
+# O mesmo resultado dá de graça o comparativo entre lojas.
+registrar_consulta("produtos_e_margem_rede", """
     SELECT 
-        da.neighborhood,
-        COUNT(s.id) AS total_deliveries,
-        AVG(s.delivery_seconds / 60.0) AS avg_delivery_minutes,
-        PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY s.delivery_seconds / 60.0) AS p90_delivery_minutes
-    FROM sales s
-    JOIN delivery_addresses da ON da.sale_id = s.id
-    WHERE s.store_id = {store_id}
-      AND s.delivery_seconds IS NOT NULL
-      AND s.sale_status_desc = 'COMPLETED'
-    GROUP BY da.neighborhood
-    HAVING COUNT(s.id) >= 10 -- Garante que a amostra é relevante
-    ORDER BY avg_delivery_minutes DESC;
+        s.store_id,
+        ps.product_id,
+        SUM(ps.total_price / ps.quantity) AS sum_sale_price,
+        COUNT(ps.total_price / ps.quantity) AS count_sale_price,
+        SUM(ps.base_price) AS sum_base_price,
+        COUNT(ps.base_price) AS count_base_price,
+        SUM(ps.quantity) AS total_quantity_sold
+    FROM product_sales ps
+    JOIN sales s ON s.id = ps.sale_id
+    WHERE s.sale_status_desc = 'COMPLETED'
+    GROUP BY s.store_id, ps.product_id;
+""")
+
+@cache_versionado('sales', 'product_sales', 'products')
+def carregar_produtos_e_margem_rede():
+    """Mesmas colunas de carregar_produtos_e_margem, mais store_id, para todas as lojas (ordenado por loja)."""
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame()
+
+    with pool.conexao() as conn:
+        df = executar_consulta(conn, "produtos_e_margem_rede")
+    return _margem_por_produto(df, por=['store_id'])
+
+registrar_consulta("performance_temporal_rede", """
+  SELECT
+    store_id,
+    day_of_week AS day_of_week_num,
+    hour_of_day,
+    bucket,
+    SUM(deliveries) AS deliveries,
+    SUM(sum_seconds) AS sum_seconds
+  FROM agg_entregas_hora_hist
+  WHERE sale_date BETWEEN $1::date AND $2::date
+  GROUP BY 1, 2, 3, 4;
+""", parametros=("start_date", "end_date"))
+
+@cache_versionado('agg_entregas_hora_hist')
+def carregar_performance_temporal_rede(start_date, end_date):
     """
-    return pd.read_sql(query, conn)
+    Retorna dois DataFrames da mesma leitura: (por loja x dia x hora, com as colunas de
+    carregar_performance_temporal mais store_id) e (resumo por loja, para o comparativo).
+    """
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame(), pd.DataFrame()
+
+    with pool.conexao() as conn:
+        df = executar_consulta(conn, "performance_temporal_rede", start_date=start_date, end_date=end_date)
+    por_hora = resumir_histograma_entregas(df, ['store_id', 'day_of_week_num', 'hour_of_day'], LARGURA_BUCKET_ENTREGA_SEGUNDOS)
+    por_loja = resumir_histograma_entregas(df, ['store_id'], LARGURA_BUCKET_ENTREGA_SEGUNDOS)
+    return por_hora, por_loja
+
+registrar_consulta("performance_por_regiao_rede", """
+    SELECT 
+        store_id,
+        neighborhood,
+        bucket,
+        SUM(deliveries) AS deliveries,
+        SUM(sum_seconds) AS sum_seconds
+    FROM agg_entregas_bairro_hist
+    WHERE sale_date BETWEEN $1::date AND $2::date
+    GROUP BY 1, 2, 3;
+""", parametros=("start_date", "end_date"))
+
+@cache_versionado('agg_entregas_bairro_hist')
+def carregar_performance_por_regiao_rede(start_date, end_date):
+    """Mesmas colunas de carregar_performance_por_regiao, mais store_id, para todas as lojas (ordenado por loja)."""
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame()
+
+    with pool.conexao() as conn:
+        df = executar_consulta(conn, "performance_por_regiao_rede", start_date=start_date, end_date=end_date)
+    df = resumir_histograma_entregas(df, ['store_id', 'neighborhood'], LARGURA_BUCKET_ENTREGA_SEGUNDOS)
+    # Garante que a amostra é relevante
+    df = df[df['total_deliveries'] >= 10]
+    return df.sort_values(by=['store_id', 'avg_delivery_minutes'], ascending=[True, False]).reset_index(drop=True)
 
 # --- 6. Modelo RFM Agregado ---
-@st.cache_data(ttl=60 * 60) # Cache de 1 hora, pois os dados mudam lentamente
-def carregar_dados_rfm_agregado(data_analise):
-    conn = conexao_banco_de_dados()
-    if conn is None: return pd.DataFrame()
+# Lê o resumo por cliente (última compra, frequência, valor) mantido de forma incremental
+# em agg_resumo_clientes (ver src/tabelas_agregadas.py); aqui só se calcula a Recência.
+# CRUCIAL: A Data de Análise (hoje) é necessária para calcular a Recência (diferença)
+# O resumo de clientes é derivado de `sales` (e dos nomes em `customers`): os carregadores do RFM
+# atualizam o resumo antes de ler e são versionados só pelas tabelas de origem. Versionar também
+# por agg_resumo_clientes faria a própria atualização mudar a chave sob a qual o resultado acabou
+# de ser calculado, e cada mudança em `sales` recalcularia tudo duas vezes.
+TABELAS_DO_RFM = ('sales', 'customers')
+_resumo_atualizado_na_versao = None
 
-    # CRUCIAL: A Data de Análise (hoje) é necessária para calcular a Recência (diferença)
-    query = f"""
-    WITH customer_summary AS (
-        SELECT
-            c.id AS customer_id,
-            c.customer_name,
-            MAX(s.created_at) AS last_sale_date,
-            COUNT(s.id) AS frequency,
-            SUM(s.total_amount) AS monetary
-        FROM customers c
-        JOIN sales s ON s.customer_id = c.id
-        WHERE s.sale_status_desc = 'COMPLETED'
-          AND c.id IS NOT NULL -- Apenas clientes identificados
-        GROUP BY c.id, c.customer_name
-    )
+def _atualizar_resumo_clientes(conn):
+    """Atualiza agg_resumo_clientes no máximo uma vez por versão das tabelas de origem (por processo)."""
+    global _resumo_atualizado_na_versao
+    versao = versao_das_tabelas(TABELAS_DO_RFM)
+    if versao != _resumo_atualizado_na_versao:
+        atualizar_resumo_clientes(conn)
+        _resumo_atualizado_na_versao = versao
+
+registrar_consulta("rfm_agregado", """
     SELECT
         customer_id,
         customer_name,
         frequency,
         monetary,
         -- Calcula a Recência em dias
-        ('{data_analise}'::date - last_sale_date::date) AS recency_days
-    FROM customer_summary
+        ($1::date - last_sale_date::date) AS recency_days
+    FROM agg_resumo_clientes
     WHERE frequency > 0
     ORDER BY recency_days ASC;
+""", parametros=("data_analise",))
+
+@cache_versionado(*TABELAS_DO_RFM)
+def carregar_dados_rfm_agregado(data_analise):
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame()
+
+    with pool.conexao() as conn:
+        # Recalcula no resumo apenas os clientes com vendas novas ou recentes (barato)
+        _atualizar_resumo_clientes(conn)
+        # Uma linha por cliente: lida em blocos para não materializar a base inteira em tuplas
+        df = ler_consulta_em_blocos(conn, "rfm_agregado", data_analise=data_analise)
+    return df
+
+def iterar_dados_rfm_agregado(data_analise, tamanho_do_bloco=50_000):
+    """
+    Mesmos dados do carregar_dados_rfm_agregado, em DataFrames de até `tamanho_do_bloco` clientes,
+    para quem processa de forma incremental (ex: exportação). Sem cache: segura uma conexão do
+    pool até o consumo terminar.
     """
-    df = pd.read_sql(query, conn)
-    return df
\ No newline at end of file
+    pool = conexao_banco_de_dados()
+    if pool is None: return
+
+    with pool.conexao() as conn:
+        _atualizar_resumo_clientes(conn)
+        yield from iterar_consulta(conn, "rfm_agregado", tamanho_do_bloco, data_analise=data_analise)
+
+# --- 7. Motor RFM no banco (scores, segmentos e paginação) ---
+# A página de Clientes não traz mais a base inteira para o pandas: limites dos sliders,
+# contagens, histogramas e a página da lista de alvos são calculados no Postgres
+# sobre agg_resumo_clientes, então a memória da página não cresce com a base de clientes.
+
+# Limiares de frequência do gráfico de lealdade: [0, 3) / [3, 10) / [10, ...)
+LIMIARES_FREQUENCIA = (3, 10)
+ROTULOS_FREQUENCIA = ('1-3x (Novos/Ocasionais)', '4-10x (Leais)', '10+x (Melhores/VIP)')
+
+# Regras de segmentação a partir dos scores R e F (1 a 5, 5 = melhor)
+SQL_SEGMENTO_RFM = """
+    CASE
+        WHEN r_score >= 4 AND f_score >= 4 THEN 'Campeões'
+        WHEN f_score >= 4 THEN 'Leais'
+        WHEN r_score >= 4 AND f_score <= 2 THEN 'Novos/Promissores'
+        WHEN r_score <= 2 AND f_score >= 3 THEN 'Em Risco'
+        WHEN r_score <= 2 THEN 'Hibernando'
+        ELSE 'Precisam de Atenção'
+    END
+"""
+
+registrar_consulta("rfm_limites", """
+    SELECT
+        COUNT(*) AS total_clientes,
+        COALESCE(MAX($1::date - last_sale_date::date), 0) AS max_recency,
+        COALESCE(MAX(frequency), 0) AS max_frequency
+    FROM agg_resumo_clientes
+    WHERE frequency > 0;
+""", parametros=("data_analise",))
+
+@cache_versionado(*TABELAS_DO_RFM)
+def carregar_limites_rfm(data_analise):
+    """Uma linha com total_clientes, max_recency e max_frequency (limites dos sliders)."""
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame()
+
+    with pool.conexao() as conn:
+        # Recalcula no resumo apenas os clientes com vendas novas ou recentes (barato)
+        _atualizar_resumo_clientes(conn)
+        return executar_consulta(conn, "rfm_limites", data_analise=data_analise)
+
+# Recência > X dias  <=>  última compra antes de (data_analise - X)
+registrar_consulta("rfm_segmento_contagem", """
+    SELECT COUNT(*) AS total_segmento
+    FROM agg_resumo_clientes
+    WHERE last_sale_date::date < $1::date - $2::int
+      AND frequency >= $3::int;
+""", parametros=("data_analise", "recency_min", "frequency_min"))
+
+registrar_consulta("rfm_segmento_pagina", """
+    SELECT
+        customer_id,
+        customer_name,
+        ($1::date - last_sale_date::date) AS recency_days,
+        frequency,
+        monetary
+    FROM agg_resumo_clientes
+    WHERE last_sale_date::date < $1::date - $2::int
+      AND frequency >= $3::int
+    ORDER BY monetary DESC, customer_id
+    LIMIT $4::int OFFSET $5::int;
+""", parametros=("data_analise", "recency_min", "frequency_min", "limite", "offset"))
+
+@cache_versionado(*TABELAS_DO_RFM)
+def carregar_segmento_rfm(data_analise, recency_min, frequency_min, limite=50, offset=0):
+    """
+    Clientes que sumiram há mais de `recency_min` dias e compraram `frequency_min`+ vezes.
+    Retorna (página ordenada por valor gasto com no máximo `limite` clientes, total do segmento).
+    A página vem como pyarrow.Table (COPY -> Arrow) e vai direto para o st.dataframe.
+    """
+    pool = conexao_banco_de_dados()
+    if pool is None: return pa.table({}), 0
+
+    filtros = dict(data_analise=data_analise, recency_min=int(recency_min), frequency_min=int(frequency_min))
+    with pool.conexao() as conn:
+        _atualizar_resumo_clientes(conn)
+        total = int(executar_consulta(conn, "rfm_segmento_contagem", **filtros)['total_segmento'].iloc[0])
+        tabela = ler_consulta_arrow(conn, "rfm_segmento_pagina", limite=int(limite), offset=int(offset), **filtros)
+    return tabela, total
+
+registrar_consulta("rfm_distribuicao_frequencia", """
+    SELECT
+        width_bucket(frequency, $1::int[]) AS grupo,
+        COUNT(*) AS total_clientes
+    FROM agg_resumo_clientes
+    WHERE frequency > 0
+    GROUP BY 1
+    ORDER BY 1;
+""", parametros=("limiares",))
+
+@cache_versionado(*TABELAS_DO_RFM)
+def carregar_distribuicao_frequencia(limiares=LIMIARES_FREQUENCIA, rotulos=ROTULOS_FREQUENCIA):
+    """Quantidade de clientes por faixa de frequência (faixas fechadas à esquerda, como pd.cut(right=False))."""
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame()
+
+    with pool.conexao() as conn:
+        _atualizar_resumo_clientes(conn)
+        df = executar_consulta(conn, "rfm_distribuicao_frequencia", limiares=list(limiares))
+    df['frequency_group'] = [rotulos[g] for g in df['grupo']]
+    return df[['frequency_group', 'total_clientes']]
+
+# Scores por quintis (NTILE): R = 5 para quem comprou mais recentemente
+registrar_consulta("rfm_segmentos_quintis", f"""
+    WITH scores AS (
+        SELECT
+            ($1::date - last_sale_date::date) AS recency_days,
+            frequency,
+            monetary,
+            NTILE(5) OVER (ORDER BY last_sale_date ASC) AS r_score,
+            NTILE(5) OVER (ORDER BY frequency ASC) AS f_score,
+            NTILE(5) OVER (ORDER BY monetary ASC) AS m_score
+        FROM agg_resumo_clientes
+        WHERE frequency > 0
+    )
+    SELECT
+        {SQL_SEGMENTO_RFM} AS segmento,
+        COUNT(*) AS total_clientes,
+        AVG(recency_days) AS avg_recency_days,
+        AVG(frequency) AS avg_frequency,
+        SUM(monetary) AS total_monetary,
+        AVG(m_score) AS avg_m_score
+    FROM scores
+    GROUP BY 1
+    ORDER BY total_clientes DESC;
+""", parametros=("data_analise",))
+
+# Scores por limiares fixos: cada lista tem 4 cortes crescentes (5 faixas)
+registrar_consulta("rfm_segmentos_limiares", f"""
+    WITH scores AS (
+        SELECT
+            ($1::date - last_sale_date::date) AS recency_days,
+            frequency,
+            monetary,
+            5 - width_bucket($1::date - last_sale_date::date, $2::int[]) AS r_score,
+            1 + width_bucket(frequency, $3::int[]) AS f_score,
+            1 + width_bucket(monetary, $4::numeric[]) AS m_score
+        FROM agg_resumo_clientes
+        WHERE frequency > 0
+    )
+    SELECT
+        {SQL_SEGMENTO_RFM} AS segmento,
+        COUNT(*) AS total_clientes,
+        AVG(recency_days) AS avg_recency_days,
+        AVG(frequency) AS avg_frequency,
+        SUM(monetary) AS total_monetary,
+        AVG(m_score) AS avg_m_score
+    FROM scores
+    GROUP BY 1
+    ORDER BY total_clientes DESC;
+""", parametros=("data_analise", "limiares_recencia", "limiares_frequencia", "limiares_monetario"))
+
+@cache_versionado(*TABELAS_DO_RFM)
+def carregar_segmentos_rfm(data_analise, limiares_recencia=None, limiares_frequencia=None, limiares_monetario=None):
+    """
+    Contagem de clientes por segmento RFM calculada no banco. Sem limiares, os scores são
+    quintis (NTILE(5)); com limiares (4 cortes crescentes cada), as faixas são fixas.
+    """
+    pool = conexao_banco_de_dados()
+    if pool is None: return pd.DataFrame()
+
+    with pool.conexao() as conn:
+        _atualizar_resumo_clientes(conn)
+        if limiares_recencia is None:
+            return executar_consulta(conn, "rfm_segmentos_quintis", data_analise=data_analise)
+        return executar_consulta(
+            conn, "rfm_segmentos_limiares", data_analise=data_analise,
+            limiares_recencia=list(limiares_recencia),
+            limiares_frequencia=list(limiares_frequencia),
+            limiares_monetario=list(limiares_monetario)
+        )
@@ -0,0 +1,281 @@
+import io
+import json
+import re
+import time
+import uuid
+from dataclasses import dataclass
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+from psycopg2 import errors
+from psycopg2.extensions import encodings
+
+from .telemetria import anotar_consulta
+
+
+# --- REGISTRO DE CONSULTAS ---
+# Cada carregador declara a sua query UMA vez, com parâmetros posicionais ($1, $2, ...).
+# A query é preparada no servidor (PREPARE) na primeira vez que é usada em cada conexão
+# do pool e, a partir daí, só é executada (EXECUTE) com os valores dos filtros.
+# Assim o Postgres não re-analisa a query a cada movimento de slider e os valores
+# nunca são concatenados no SQL (fecha a brecha de SQL injection).
+@dataclass(frozen=True)
+class Consulta:
+    nome: str
+    sql: str
+    parametros: tuple = ()
+
+
+CONSULTAS = {}
+
+# Últimos tempos medidos por consulta (preparo x execução), em milissegundos
+TEMPOS_DAS_CONSULTAS = {}
+
+
+def registrar_consulta(nome, sql, parametros=()):
+    """Declara uma consulta no registro. `parametros` dá o nome de cada placeholder $1, $2, ... na ordem."""
+    if nome in CONSULTAS and CONSULTAS[nome].sql != sql.strip().rstrip(';'):
+        raise ValueError(f"Consulta '{nome}' já registrada com outro SQL.")
+    CONSULTAS[nome] = Consulta(nome=nome, sql=sql.strip().rstrip(';'), parametros=tuple(parametros))
+    return CONSULTAS[nome]
+
+
+def _valores_dos_parametros(consulta, parametros):
+    faltando = [p for p in consulta.parametros if p not in parametros]
+    if faltando:
+        raise TypeError(f"Consulta '{consulta.nome}' sem valor para: {', '.join(faltando)}")
+    return [parametros[p] for p in consulta.parametros]
+
+
+def _preparar(cur, conn, consulta):
+    """Executa o PREPARE da consulta nesta conexão (uma única vez). Retorna o tempo gasto em segundos."""
+    if consulta.nome in conn.preparadas:
+        return 0.0
+    inicio = time.perf_counter()
+    try:
+        cur.execute(f"PREPARE {consulta.nome} AS {consulta.sql}")
+    except errors.DuplicatePreparedStatement:
+        pass
+    conn.preparadas.add(consulta.nome)
+    return time.perf_counter() - inicio
+
+
+def _comando_execute(consulta):
+    if not consulta.parametros:
+        return f"EXECUTE {consulta.nome}"
+    return f"EXECUTE {consulta.nome} ({', '.join(['%s'] * len(consulta.parametros))})"
+
+
+def executar_consulta(conn, nome, **parametros):
+    """
+    Executa a consulta registrada `nome` através do prepared statement da conexão
+    e retorna o resultado como DataFrame.
+    """
+    consulta = CONSULTAS[nome]
+    valores = _valores_dos_parametros(consulta, parametros)
+
+    with conn.cursor() as cur:
+        tempo_preparo = _preparar(cur, conn, consulta)
+        inicio = time.perf_counter()
+        try:
+            cur.execute(_comando_execute(consulta), valores)
+        except errors.InvalidSqlStatementName:
+            # O statement sumiu da sessão (ex: DISCARD ALL no servidor): prepara de novo
+            conn.preparadas.discard(consulta.nome)
+            tempo_preparo += _preparar(cur, conn, consulta)
+            inicio = time.perf_counter()
+            cur.execute(_comando_execute(consulta), valores)
+        tempo_execucao = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        linhas = cur.fetchall()
+        colunas = [coluna.name for coluna in cur.description]
+
+    # coerce_float=True mantém o comportamento do pd.read_sql (Decimal -> float)
+    df = pd.DataFrame.from_records(linhas, columns=colunas, coerce_float=True)
+    tempo_leitura = time.perf_counter() - inicio
+
+    # prepare_ms é o round trip do PREPARE (parse e análise no servidor), não o planejamento:
+    # o plano é feito no EXECUTE. Planejamento x execução no servidor vêm de medir_planejamento
+    # (e das capturas de consultas lentas), que atualizam as mesmas entradas.
+    TEMPOS_DAS_CONSULTAS.setdefault(nome, {}).update({
+        'prepare_ms': 1000 * tempo_preparo,
+        'execucao_ms': 1000 * tempo_execucao,
+        'leitura_ms': 1000 * tempo_leitura,
+    })
+    anotar_consulta(1000 * (tempo_preparo + tempo_execucao), 1000 * tempo_leitura)
+
+    # Acima do limite configurado, o plano é capturado em segundo plano (src/consultas_lentas.py)
+    from .consultas_lentas import verificar_consulta_lenta
+    verificar_consulta_lenta(nome, {p: parametros[p] for p in consulta.parametros}, 1000 * tempo_execucao)
+    return df
+
+
+# --- LEITURA EM BLOCOS (cursor no servidor) ---
+# O executar_consulta materializa o resultado inteiro como tuplas Python antes de montar o
+# DataFrame: para resultados grandes (ex: todos os clientes do RFM) o pico de memória é várias
+# vezes o DataFrame final. Aqui a query roda num cursor nomeado (DECLARE ... CURSOR no
+# servidor) e as linhas chegam em blocos de tamanho fixo, convertidos logo em colunas.
+# Cursores nomeados não aceitam EXECUTE de prepared statement, então o SQL é enviado direto.
+TAMANHO_DO_BLOCO = 50_000
+
+
+def _sql_com_parametros_nomeados(consulta):
+    """SQL da consulta com $1, $2, ... trocados por %(nome)s (formato do psycopg2)."""
+    sql = consulta.sql.replace('%', '%%')
+    return re.sub(r'\$(\d+)', lambda m: f"%({consulta.parametros[int(m.group(1)) - 1]})s", sql)
+
+
+def iterar_consulta(conn, nome, tamanho_do_bloco=TAMANHO_DO_BLOCO, **parametros):
+    """
+    Gera o resultado da consulta registrada `nome` em DataFrames de até `tamanho_do_bloco`
+    linhas, lidos de um cursor no servidor. A conexão fica ocupada até o gerador terminar.
+    """
+    consulta = CONSULTAS[nome]
+    valores = dict(zip(consulta.parametros, _valores_dos_parametros(consulta, parametros)))
+
+    # Cursores no servidor só existem dentro de uma transação
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        with conn.cursor(name=f"{nome}_{uuid.uuid4().hex[:8]}") as cur:
+            inicio = time.perf_counter()
+            cur.execute(_sql_com_parametros_nomeados(consulta), valores)
+            linhas = cur.fetchmany(tamanho_do_bloco)
+            # O primeiro bloco inclui a execução da query no servidor
+            tempo_execucao = time.perf_counter() - inicio
+            tempo_leitura = 0.0
+            colunas = [coluna.name for coluna in cur.description]
+            blocos = 0
+            while linhas or blocos == 0:
+                inicio = time.perf_counter()
+                df = pd.DataFrame.from_records(linhas, columns=colunas, coerce_float=True)
+                del linhas
+                tempo_leitura += time.perf_counter() - inicio
+                blocos += 1
+                yield df
+                inicio = time.perf_counter()
+                linhas = cur.fetchmany(tamanho_do_bloco)
+                tempo_leitura += time.perf_counter() - inicio
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = autocommit
+
+    anotar_consulta(1000 * tempo_execucao, 1000 * tempo_leitura)
+    from .consultas_lentas import verificar_consulta_lenta
+    verificar_consulta_lenta(nome, valores, 1000 * tempo_execucao)
+
+
+def ler_consulta_em_blocos(conn, nome, tamanho_do_bloco=TAMANHO_DO_BLOCO, **parametros):
+    """Mesmo resultado do executar_consulta, mas lido em blocos (menor pico de memória)."""
+    return pd.concat(list(iterar_consulta(conn, nome, tamanho_do_bloco, **parametros)), ignore_index=True)
+
+
+# --- CAMINHO COLUNAR (COPY -> Arrow) ---
+# Para resultados que vão direto para a tela, o caminho tuplas -> pandas -> Arrow (que o
+# st.dataframe faz de novo ao enviar ao navegador) é trocado por COPY ... TO STDOUT: o Postgres
+# manda o resultado em CSV e o leitor do pyarrow monta as colunas já tipadas, sem objetos
+# Python por linha. (O COPY binário exigiria um decodificador próprio do formato do Postgres.)
+# Os tipos vêm das colunas da própria query (OID do Postgres -> tipo Arrow), não de inferência.
+TIPOS_ARROW_POR_OID = {
+    16: pa.bool_(),
+    20: pa.int64(), 21: pa.int16(), 23: pa.int32(),
+    700: pa.float32(), 701: pa.float64(), 1700: pa.float64(),
+    1082: pa.date32(), 1114: pa.timestamp('us'), 1184: pa.timestamp('us', tz='UTC'),
+}
+
+_colunas_arrow = {}
+
+
+def _esquema_arrow(cur, consulta, sql_parametrizado, valores):
+    """Nomes e tipos Arrow das colunas da consulta (descobertos uma vez, com LIMIT 0)."""
+    if consulta.nome not in _colunas_arrow:
+        cur.execute(f"SELECT * FROM ({sql_parametrizado}) AS consulta LIMIT 0", valores)
+        _colunas_arrow[consulta.nome] = [
+            (coluna.name, TIPOS_ARROW_POR_OID.get(coluna.type_code, pa.string())) for coluna in cur.description
+        ]
+    return _colunas_arrow[consulta.nome]
+
+
+def ler_consulta_arrow(conn, nome, **parametros):
+    """Executa a consulta registrada `nome` via COPY e retorna o resultado como pyarrow.Table."""
+    consulta = CONSULTAS[nome]
+    valores = dict(zip(consulta.parametros, _valores_dos_parametros(consulta, parametros)))
+    sql = _sql_com_parametros_nomeados(consulta)
+
+    with conn.cursor() as cur:
+        colunas = _esquema_arrow(cur, consulta, sql, valores)
+        # mogrify faz o escape dos valores no cliente: COPY não aceita parâmetros
+        comando = cur.mogrify(sql, valores).decode(encodings[conn.encoding])
+        buffer = io.BytesIO()
+        inicio = time.perf_counter()
+        cur.copy_expert(f"COPY ({comando}) TO STDOUT WITH (FORMAT csv)", buffer)
+        tempo_execucao = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    if buffer.tell() == 0:
+        # Resultado vazio: o COPY não escreve nada e o leitor de CSV recusaria o arquivo vazio
+        tabela = pa.schema(colunas).empty_table()
+    else:
+        buffer.seek(0)
+        tabela = _ler_csv_do_copy(buffer, colunas)
+    tempo_leitura = time.perf_counter() - inicio
+
+    anotar_consulta(1000 * tempo_execucao, 1000 * tempo_leitura)
+    from .consultas_lentas import verificar_consulta_lenta
+    verificar_consulta_lenta(nome, valores, 1000 * tempo_execucao)
+    return tabela
+
+
+def _ler_csv_do_copy(buffer, colunas):
+    return pa_csv.read_csv(
+        buffer,
+        read_options=pa_csv.ReadOptions(column_names=[nome_coluna for nome_coluna, _ in colunas]),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=dict(colunas),
+            # No CSV do Postgres, NULL é o campo vazio sem aspas; "" é texto vazio
+            null_values=[''], strings_can_be_null=True, quoted_strings_can_be_null=False,
+            true_values=['t'], false_values=['f'],
+        ),
+    )
+
+
+def explicar_consulta(conn, nome, opcoes="FORMAT JSON", **parametros):
+    """Roda EXPLAIN (<opcoes>) EXECUTE da consulta preparada e retorna o plano (JSON) do nó raiz."""
+    consulta = CONSULTAS[nome]
+    valores = _valores_dos_parametros(consulta, parametros)
+    with conn.cursor() as cur:
+        _preparar(cur, conn, consulta)
+        cur.execute(f"EXPLAIN ({opcoes}) " + _comando_execute(consulta), valores)
+        plano = cur.fetchone()[0]
+    if isinstance(plano, str):
+        plano = json.loads(plano)
+    return plano[0]
+
+
+def nos_do_plano(plano):
+    """Percorre (em profundidade) todos os nós de um plano JSON do EXPLAIN."""
+    pilha = [plano['Plan'] if 'Plan' in plano else plano]
+    while pilha:
+        no = pilha.pop()
+        yield no
+        pilha.extend(no.get('Plans', []))
+
+
+def medir_planejamento(conn, nome, **parametros):
+    """
+    Mede no servidor o tempo de planejamento x execução da consulta preparada,
+    usando EXPLAIN (ANALYZE) EXECUTE. Útil para confirmar que o plano está sendo
+    reaproveitado (planejamento perto de zero nas execuções seguintes).
+    """
+    plano = explicar_consulta(conn, nome, opcoes="ANALYZE, TIMING OFF, SUMMARY ON, FORMAT JSON", **parametros)
+    tempos = {
+        'planejamento_ms': plano.get('Planning Time', 0.0),
+        'execucao_servidor_ms': plano.get('Execution Time', 0.0),
+    }
+    TEMPOS_DAS_CONSULTAS.setdefault(nome, {}).update(tempos)
+    return tempos
@@ -0,0 +1,168 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+import streamlit as st
+
+from .consultas import CONSULTAS, TEMPOS_DAS_CONSULTAS, explicar_consulta, nos_do_plano
+
+
+# --- CAPTURA DE PLANOS DE CONSULTAS LENTAS ---
+# Quando uma consulta registrada demora mais que o limite configurado, ela é executada de novo
+# numa thread com EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON). O plano é gravado em JSON junto com
+# os parâmetros e com alertas dos problemas mais comuns (Seq Scan, ordenação em disco e erro de
+# estimativa de linhas). Assim dá para corrigir uma regressão sem precisar reproduzi-la à mão.
+# (O auto_explain do Postgres faria o mesmo no servidor, mas exige shared_preload_libraries.)
+
+LIMITE_PADRAO_MS = 500.0
+# Uma mesma consulta com os mesmos parâmetros é capturada no máximo uma vez nesse intervalo
+INTERVALO_ENTRE_CAPTURAS = 10 * 60
+# Assinaturas (consulta + parâmetros) lembradas ao mesmo tempo, além da expiração pelo intervalo
+MAX_ASSINATURAS = 1000
+# Erro de estimativa: linhas reais x estimadas diferindo mais que esse fator (em nós com linhas relevantes)
+FATOR_ERRO_ESTIMATIVA = 10
+LINHAS_MINIMAS_ESTIMATIVA = 1000
+
+_fila = queue.Queue(maxsize=20)
+_trava = threading.Lock()
+# assinatura -> instante da última captura, da mais antiga para a mais recente
+_ultimas_capturas = OrderedDict()
+_capturas = deque(maxlen=50)
+_config = None
+_trabalhador = None
+
+
+def _configuracao():
+    """Lê [consultas_lentas] do secrets.toml (ativo, limite_ms, diretorio) uma única vez."""
+    global _config
+    if _config is None:
+        try:
+            config = dict(st.secrets.get("consultas_lentas", {}))
+        except Exception:
+            config = {}
+        _config = {
+            'ativo': config.get('ativo', True),
+            'limite_ms': float(config.get('limite_ms', LIMITE_PADRAO_MS)),
+            'diretorio': config.get('diretorio', os.path.join('.cache', 'planos')),
+        }
+    return _config
+
+
+# --- ANÁLISE DO PLANO ---
+
+def alertas_do_plano(plano):
+    """Lista os problemas encontrados nos nós de um plano de EXPLAIN ANALYZE (JSON)."""
+    alertas = []
+    for no in nos_do_plano(plano):
+        tipo = no.get('Node Type')
+        if tipo == 'Seq Scan':
+            alertas.append({
+                'tipo': 'seq_scan',
+                'detalhe': f"Seq Scan em {no.get('Relation Name')} ({no.get('Actual Rows', 0):,} linhas lidas)",
+            })
+        if no.get('Sort Space Type') == 'Disk':
+            alertas.append({
+                'tipo': 'ordenacao_em_disco',
+                'detalhe': f"Sort em disco ({no.get('Sort Space Used', 0)} kB) por {no.get('Sort Key')}",
+            })
+        if no.get('Hash Batches', 1) > 1:
+            alertas.append({
+                'tipo': 'hash_em_disco',
+                'detalhe': f"Hash dividido em {no['Hash Batches']} lotes (work_mem insuficiente)",
+            })
+        estimadas = no.get('Plan Rows', 0)
+        reais = no.get('Actual Rows', 0)
+        if max(estimadas, reais) >= LINHAS_MINIMAS_ESTIMATIVA:
+            fator = max(estimadas, reais) / max(min(estimadas, reais), 1)
+            if fator >= FATOR_ERRO_ESTIMATIVA:
+                alertas.append({
+                    'tipo': 'erro_de_estimativa',
+                    'detalhe': f"{tipo}: {estimadas:,} linhas estimadas x {reais:,} reais ({fator:.0f}x)",
+                })
+    return alertas
+
+
+# --- CAPTURA ---
+
+def verificar_consulta_lenta(nome, parametros, execucao_ms):
+    """Chamado após cada execução: agenda a captura do plano se a consulta passou do limite."""
+    config = _configuracao()
+    if not config['ativo'] or execucao_ms <= config['limite_ms']:
+        return
+    assinatura = (nome, json.dumps(parametros, sort_keys=True, default=str))
+    agora = time.time()
+    with _trava:
+        if agora - _ultimas_capturas.get(assinatura, 0) < INTERVALO_ENTRE_CAPTURAS:
+            return
+        _ultimas_capturas[assinatura] = agora
+        _ultimas_capturas.move_to_end(assinatura)
+        # Descarta as assinaturas que já saíram do intervalo (e as mais antigas, acima do limite)
+        while _ultimas_capturas:
+            mais_antiga = next(iter(_ultimas_capturas.values()))
+            if agora - mais_antiga < INTERVALO_ENTRE_CAPTURAS and len(_ultimas_capturas) <= MAX_ASSINATURAS:
+                break
+            _ultimas_capturas.popitem(last=False)
+    _iniciar_trabalhador()
+    try:
+        _fila.put_nowait((nome, dict(parametros), execucao_ms))
+    except queue.Full:
+        pass  # Banco sobrecarregado: melhor perder a captura do que empilhar mais EXPLAIN ANALYZE
+
+
+def capturar_plano(conn, nome, parametros, execucao_ms=None):
+    """Roda EXPLAIN (ANALYZE, BUFFERS) da consulta, grava o JSON no diretório configurado e retorna a captura."""
+    plano = explicar_consulta(conn, nome, opcoes="ANALYZE, BUFFERS, FORMAT JSON", **parametros)
+    captura = {
+        'consulta': nome,
+        'parametros': {p: parametros[p] for p in CONSULTAS[nome].parametros},
+        'execucao_ms': execucao_ms,
+        'execucao_explain_ms': plano.get('Execution Time'),
+        'planejamento_ms': plano.get('Planning Time'),
+        'alertas': alertas_do_plano(plano),
+        'capturado_em': datetime.now().isoformat(timespec='seconds'),
+        'plano': plano,
+    }
+    diretorio = _configuracao()['diretorio']
+    os.makedirs(diretorio, exist_ok=True)
+    caminho = os.path.join(diretorio, f"{datetime.now():%Y%m%d_%H%M%S}_{nome}.json")
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(captura, arquivo, ensure_ascii=False, indent=2, default=str)
+    captura['arquivo'] = caminho
+    with _trava:
+        _capturas.append(captura)
+    # Planejamento x execução no servidor, ao lado dos tempos medidos no cliente
+    TEMPOS_DAS_CONSULTAS.setdefault(nome, {}).update({
+        'planejamento_ms': captura['planejamento_ms'],
+        'execucao_servidor_ms': captura['execucao_explain_ms'],
+    })
+    return captura
+
+
+def _capturar_da_fila():
+    from .carregamento_de_dados import conexao_banco_de_dados
+
+    while True:
+        nome, parametros, execucao_ms = _fila.get()
+        try:
+            with conexao_banco_de_dados().conexao() as conn:
+                capturar_plano(conn, nome, parametros, execucao_ms)
+        except Exception as e:
+            print(f"✗ Falha ao capturar o plano de {nome}: {e}")
+
+
+def _iniciar_trabalhador():
+    global _trabalhador
+    with _trava:
+        if _trabalhador is None:
+            _trabalhador = threading.Thread(target=_capturar_da_fila, name='captura-de-planos', daemon=True)
+            _trabalhador.start()
+
+
+def capturas_recentes():
+    """Capturas feitas por este processo, da mais recente para a mais antiga."""
+    with _trava:
+        return list(reversed(_capturas))
@@ -0,0 +1,126 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .consultas import registrar_consulta, executar_consulta
+from .versao_dos_dados import cache_versionado, versao_das_tabelas
+from .organizacao_dos_dados import formatar_nome_loja
+
+
+# --- DICIONÁRIO DE DIMENSÕES ---
+# Lojas, canais, produtos, itens e formas de pagamento mudam raramente e são pequenos.
+# Ficam UMA vez por processo (e por versão das tabelas) em arrays id -> nome, e as consultas
+# de fatos devolvem só os ids: os nomes são decodificados em memória, de forma vetorizada,
+# sem JOIN no banco e sem uma cópia dos metadados no st.session_state de cada sessão.
+
+TABELAS_DE_DIMENSAO = ('stores', 'channels', 'products', 'items', 'payment_types')
+
+registrar_consulta("dimensao_lojas", "SELECT id, name, is_active FROM stores ORDER BY id;")
+registrar_consulta("dimensao_canais", "SELECT id, name FROM channels ORDER BY id;")
+registrar_consulta("dimensao_produtos", "SELECT id, name FROM products ORDER BY id;")
+registrar_consulta("dimensao_itens", "SELECT id, name FROM items ORDER BY id;")
+registrar_consulta("dimensao_formas_de_pagamento", "SELECT id, description AS name FROM payment_types ORDER BY id;")
+
+
+class Dimensao:
+    """
+    Uma tabela de dimensão (id, name) em arrays NumPy.
+
+    `codigo_por_id[id]` é o código do nome em `categorias` (nomes únicos, em ordem), então
+    decodificar uma coluna inteira de ids é uma indexação de array + pd.Categorical.from_codes.
+    Ids desconhecidos viram NaN. Nomes repetidos (ex: dois produtos iguais) compartilham o código.
+    """
+
+    def __init__(self, df):
+        self.ids = df['id'].to_numpy(dtype=np.int64) if not df.empty else np.array([], dtype=np.int64)
+        self.nomes = df['name'].to_numpy(dtype=object) if not df.empty else np.array([], dtype=object)
+        self.categorias, codigos = np.unique(self.nomes.astype(str), return_inverse=True)
+        self.codigo_por_id = np.full(int(self.ids.max()) + 1 if len(self.ids) else 0, -1, dtype=np.int32)
+        self.codigo_por_id[self.ids] = codigos
+        self._id_por_nome = dict(zip(self.nomes, self.ids.tolist()))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nome(self, id_):
+        codigo = self.codigo_por_id[id_] if 0 <= id_ < len(self.codigo_por_id) else -1
+        return self.categorias[codigo] if codigo >= 0 else None
+
+    def id_por_nome(self, nome):
+        return self._id_por_nome.get(nome)
+
+    def decodificar(self, ids):
+        """Coluna de ids -> pd.Categorical com os nomes (vetorizado)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        validos = (ids >= 0) & (ids < len(self.codigo_por_id))
+        codigos = np.full(len(ids), -1, dtype=np.int32)
+        codigos[validos] = self.codigo_por_id[ids[validos]]
+        return pd.Categorical.from_codes(codigos, categories=self.categorias)
+
+
+class Lojas(Dimensao):
+    """Dimensão de lojas com os nomes de exibição já formatados e a lista das lojas ativas."""
+
+    def __init__(self, df):
+        super().__init__(df)
+        self.exibicao_por_id = {id_: formatar_nome_loja(nome) for id_, nome in zip(self.ids.tolist(), self.nomes)}
+        ativas = df['is_active'].fillna(True).to_numpy(dtype=bool) if not df.empty else np.array([], dtype=bool)
+        # Opções dos selectbox: ids (int do Python) das lojas ativas, na ordem do id
+        self.ids_ativos = self.ids[ativas].tolist()
+
+    def exibicao(self, id_):
+        return self.exibicao_por_id.get(id_, str(id_))
+
+
+class Dimensoes:
+    def __init__(self, lojas, canais, produtos, itens, formas_de_pagamento):
+        self.lojas = Lojas(lojas)
+        self.canais = Dimensao(canais)
+        self.produtos = Dimensao(produtos)
+        self.itens = Dimensao(itens)
+        self.formas_de_pagamento = Dimensao(formas_de_pagamento)
+
+
+@cache_versionado(*TABELAS_DE_DIMENSAO)
+def carregar_dimensoes():
+    """Carrega as tabelas de dimensão (id, name) e retorna cinco DataFrames."""
+    from .carregamento_de_dados import conexao_banco_de_dados
+
+    pool = conexao_banco_de_dados()
+    if pool is None:
+        # Mesmas colunas das consultas, para os arrays ficarem vazios em vez de quebrar
+        vazio = pd.DataFrame({'id': pd.Series(dtype='int64'), 'name': pd.Series(dtype=object)})
+        return vazio.assign(is_active=pd.Series(dtype=bool)), vazio, vazio, vazio, vazio
+
+    with pool.conexao() as conn:
+        return tuple(
+            executar_consulta(conn, nome)
+            for nome in ("dimensao_lojas", "dimensao_canais", "dimensao_produtos",
+                         "dimensao_itens", "dimensao_formas_de_pagamento")
+        )
+
+
+_trava = threading.Lock()
+_atual = {'versao': None, 'dimensoes': None}
+
+
+def dimensoes():
+    """Dicionário de dimensões do processo, reconstruído só quando alguma tabela de dimensão muda."""
+    versao = versao_das_tabelas(TABELAS_DE_DIMENSAO)
+    with _trava:
+        if _atual['versao'] == versao:
+            return _atual['dimensoes']
+    construidas = Dimensoes(*carregar_dimensoes())
+    with _trava:
+        _atual['versao'], _atual['dimensoes'] = versao, construidas
+    return construidas
+
+
+def decodificar(df, coluna_id, dimensao, coluna_nome):
+    """Troca a coluna de ids `coluna_id` pela coluna categórica `coluna_nome`, na mesma posição."""
+    posicao = df.columns.get_loc(coluna_id)
+    nomes = dimensao.decodificar(df[coluna_id].to_numpy()) if not df.empty else pd.Categorical([])
+    df = df.drop(columns=coluna_id)
+    df.insert(posicao, coluna_nome, nomes)
+    return df
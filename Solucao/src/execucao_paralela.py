@@ -0,0 +1,55 @@
+import threading
+from concurrent.futures import Future
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+
+# --- CARREGAMENTO PARALELO DAS SEÇÕES ---
+# As seções de uma página são independentes, mas os carregadores eram chamados um após o
+# outro: o tempo da página era a SOMA das queries. A página declara no topo tudo o que vai
+# precisar; cada carregador roda numa thread (com a sua conexão do pool) e cada seção só
+# espera pelo próprio resultado. O tempo da página passa a ser o da query mais lenta, e as
+# primeiras seções já aparecem enquanto as outras ainda carregam.
+# Spinners: o st.cache_data mostraria um spinner por carregador, emitido das threads de
+# carregamento (que não são a thread do script). Nelas os carregadores rodam sem spinner
+# (`.sem_spinner` do cache_versionado); cada seção mostra o seu, na thread do script, só
+# enquanto espera pelo próprio resultado (`aguardar`).
+
+def _executar(futuro, carregador, kwargs):
+    if not futuro.set_running_or_notify_cancel():
+        return
+    try:
+        futuro.set_result(carregador(**kwargs))
+    except BaseException as e:
+        futuro.set_exception(e)
+
+
+def carregar_em_paralelo(**chamadas):
+    """
+    Dispara os carregadores ao mesmo tempo e retorna {nome: Future}, sem esperar por eles.
+    Cada chamada é `nome=(carregador, {argumentos nomeados})`; use `aguardar` na seção que
+    exibe o dado. Os argumentos devem ser os mesmos (e nomeados) da chamada direta, para
+    reaproveitar as mesmas entradas de cache.
+    """
+    # As threads herdam o contexto da sessão (o st.cache_data o consulta), mas não emitem nada:
+    # carregadores do cache_versionado são chamados pela variante sem spinner
+    contexto = get_script_run_ctx()
+    futuros = {}
+    for nome, (carregador, kwargs) in chamadas.items():
+        futuro = futuros[nome] = Future()
+        thread = threading.Thread(
+            target=_executar, args=(futuro, getattr(carregador, 'sem_spinner', carregador), kwargs),
+            name=f"carregar-{nome}", daemon=True
+        )
+        add_script_run_ctx(thread, contexto)
+        thread.start()
+    return futuros
+
+
+def aguardar(futuro, mensagem="Carregando..."):
+    """Resultado de um Future de `carregar_em_paralelo`; se ainda não chegou, espera sob um spinner."""
+    if futuro.done():
+        return futuro.result()
+    with st.spinner(mensagem):
+        return futuro.result()
@@ -1,22 +1,20 @@
 import streamlit as st
-import pandas as pd
-from datetime import date
-from .carregamento_de_dados import carregar_metadados
+from .organizacao_dos_dados import periodo_padrao
+from .aquecimento_de_cache import iniciar_aquecimento
 
 #   INICIALIZAÇÃO DE VARIÁVEIS DE ESTADO
 # Garante que a data de fim exista (default: hoje)
 def inicializar_dados():
+    # Aquece o cache dos filtros padrão em segundo plano (uma vez por processo)
+    iniciar_aquecimento()
+
+    inicio_padrao, fim_padrao = periodo_padrao()
     if 'end_date' not in st.session_state:
-        st.session_state['end_date'] = date.today()
+        st.session_state['end_date'] = fim_padrao
     
     # Garante que a data de início exista (default: 6 meses atrás)
     if 'start_date' not in st.session_state:
-        # Converte para datetime para fazer o cálculo e volta para date
-        calculated_start_date = (pd.to_datetime(date.today()) - pd.DateOffset(months=6)).date()
-        st.session_state['start_date'] = calculated_start_date
+        st.session_state['start_date'] = inicio_padrao
 
-# BLOCO DE INICIALIZAÇÃO DE METADADOS
-    if 'metadata_loaded' not in st.session_state:
-        with st.spinner('Carregando dados estáticos e metadados...'):
-            st.session_state['df_stores'], st.session_state['df_channels'] = carregar_metadados()
-        st.session_state['metadata_loaded'] = True
\ No newline at end of file
+    # Metadados (lojas, canais, produtos...) não ficam mais no session_state de cada sessão:
+    # as páginas usam o dicionário de dimensões do processo (src/dimensoes.py)
\ No newline at end of file
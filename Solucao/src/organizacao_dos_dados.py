@@ -1,3 +1,17 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Dia da semana (nome exibido nos filtros) -> número do EXTRACT(DOW) do Postgres (0=Domingo)
+DIAS_DA_SEMANA_SQL = {"Segunda": 1, "Terça": 2, "Quarta": 3, "Quinta": 4, "Sexta": 5, "Sábado": 6, "Domingo": 0}
+
+# Valores iniciais dos filtros das páginas (usados também pelo aquecimento do cache)
+MESES_DO_PERIODO_PADRAO = 6
+RECENCIA_PADRAO = 30
+FREQUENCIA_PADRAO = 3
+CLIENTES_POR_PAGINA = 50
+
 # Função para corrigir o nome da loja
 def formatar_nome_loja(nome_invertido):
     """
@@ -32,3 +46,138 @@ def formatar_nome_loja(nome_invertido):
             
     # Se não houver separação, retorna o nome original (ex: 'Loja X')
     return nome_invertido
+
+
+# Top N produtos a partir do cubo da loja (canal x dia x hora x produto), sem ir ao banco
+def top_produtos_do_cubo(cubo, channel_name, day_of_week, hour_min, hour_max, n=10):
+    """
+    Responde o ranking de produtos para qualquer combinação de canal/dia/janela de horário
+    fatiando o cubo em memória (máscaras NumPy + bincount nos códigos dos produtos).
+    Retorna as mesmas colunas de `carregar_top_produtos`: product_name, total_vendido.
+    """
+    vazio = pd.DataFrame({'product_name': pd.Series(dtype=object), 'total_vendido': pd.Series(dtype=float)})
+    canais = cubo['channel_name'].cat.categories if not cubo.empty else []
+    if channel_name not in canais:
+        return vazio
+
+    horas = cubo['hour_of_day'].to_numpy()
+    mascara = (
+        (cubo['channel_name'].cat.codes.to_numpy() == canais.get_loc(channel_name))
+        & (cubo['day_of_week'].to_numpy() == DIAS_DA_SEMANA_SQL.get(day_of_week))
+        & (horas >= hour_min)
+        & (horas <= hour_max)
+    )
+    if not mascara.any():
+        return vazio
+
+    # Soma a quantidade por produto (o código da categoria já agrupa produtos de mesmo nome)
+    produtos = cubo['product_name'].cat.categories
+    totais = np.bincount(
+        cubo['product_name'].cat.codes.to_numpy()[mascara],
+        weights=cubo['total_quantity'].to_numpy()[mascara],
+        minlength=len(produtos)
+    )
+    n = min(n, int((totais > 0).sum()))
+    top = np.argpartition(-totais, n - 1)[:n]
+    top = top[np.argsort(-totais[top], kind='stable')]
+    return pd.DataFrame({'product_name': produtos[top].to_numpy(), 'total_vendido': totais[top]})
+
+
+# Recorte de uma loja num resultado do modo frota (ordenado por store_id)
+def particao_da_loja(df, store_id, coluna='store_id'):
+    """
+    Retorna as linhas de `store_id` sem a coluna da loja. Como o resultado da rede vem ordenado
+    por loja, o recorte é uma busca binária + fatia contígua, não uma máscara sobre a rede inteira.
+    """
+    if df.empty:
+        return df.drop(columns=coluna, errors='ignore')
+    lojas = df[coluna].to_numpy()
+    inicio = np.searchsorted(lojas, store_id, side='left')
+    fim = np.searchsorted(lojas, store_id, side='right')
+    return df.iloc[inicio:fim].drop(columns=coluna).reset_index(drop=True)
+
+
+# Re-agregação exata do ticket médio a partir das parciais somáveis (soma e contagem)
+def reagregar_ticket(df, por=(), frequencia=None, coluna_data='sale_date'):
+    """
+    Agrupa as parciais `sum_amount`/`sale_count` em qualquer grão mais grosso e recalcula
+    `avg_ticket = soma / contagem`. Diferente de tirar a média das médias diárias, o resultado
+    é exatamente o ticket médio do período.
+
+    Ex: reagregar_ticket(df_loja, por=['store_name'])           -> ticket do período por loja
+        reagregar_ticket(df_canal, por=['channel_name'], frequencia='W') -> ticket semanal por canal
+    """
+    chaves = list(por)
+    if frequencia is not None:
+        chaves.insert(0, pd.Grouper(key=coluna_data, freq=frequencia))
+
+    if chaves:
+        agregado = df.groupby(chaves, observed=True)[['sum_amount', 'sale_count']].sum().reset_index()
+    else:
+        agregado = df[['sum_amount', 'sale_count']].sum().to_frame().T
+
+    agregado['avg_ticket'] = agregado['sum_amount'] / agregado['sale_count']
+    return agregado
+
+
+# Percentil a partir de um histograma de buckets de largura fixa
+def percentis_do_histograma(buckets, contagens, inicios, q, largura_bucket):
+    """
+    Percentil `q` (0-1) de vários histogramas de uma vez, com interpolação linear dentro do
+    bucket onde ele cai. Cada grupo ocupa as linhas de `inicios[k]` até o início do próximo,
+    com os buckets em ordem crescente. O erro em relação ao percentil exato é no máximo `largura_bucket`.
+    """
+    contagens = np.asarray(contagens, dtype=float)
+    # Uma soma acumulada para todos os grupos: o alvo de cada grupo é deslocado pelo que veio antes dele
+    acumulado = np.concatenate(([0.0], np.cumsum(contagens)))
+    fins = np.append(inicios[1:], len(contagens))
+    base = acumulado[inicios]
+    alvo = base + q * (acumulado[fins] - base)
+    i = np.clip(np.searchsorted(acumulado[1:], alvo, side='left'), inicios, fins - 1)
+    fracao = np.divide(alvo - acumulado[i], contagens[i], out=np.zeros(len(i)), where=contagens[i] > 0)
+    return (np.asarray(buckets)[i] + fracao) * largura_bucket
+
+
+# Resumo (média exata + percentis) de histogramas de entrega agrupados por `chaves`
+def resumir_histograma_entregas(df, chaves, largura_bucket, percentis=(0.5, 0.9, 0.99)):
+    """
+    Recebe linhas (chaves..., bucket, deliveries, sum_seconds) e, para cada grupo de `chaves`,
+    soma os buckets e devolve total_deliveries, avg_delivery_minutes (exata) e
+    pXX_delivery_minutes para cada percentil pedido (erro <= 1 bucket).
+    """
+    chaves = list(chaves)
+    colunas_dos_percentis = [f"p{int(round(q * 100))}_delivery_minutes" for q in percentis]
+    if df.empty:
+        return pd.DataFrame(columns=chaves + ['total_deliveries', 'avg_delivery_minutes'] + colunas_dos_percentis)
+
+    # Funde buckets repetidos do mesmo grupo (ex: vários dias somados na mesma hora); o resultado
+    # sai ordenado por chaves + bucket, então cada grupo é um bloco contíguo de linhas
+    df = df.groupby(chaves + ['bucket'], dropna=False, sort=True)[['deliveries', 'sum_seconds']].sum().reset_index()
+    grupos = df.groupby(chaves, dropna=False, sort=True).ngroup().to_numpy()
+    inicios = np.flatnonzero(np.diff(grupos, prepend=-1))
+
+    contagens = df['deliveries'].to_numpy(dtype=float)
+    total = np.add.reduceat(contagens, inicios)
+    resumo = df[chaves].iloc[inicios].reset_index(drop=True)
+    resumo['total_deliveries'] = total.astype('int64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        resumo['avg_delivery_minutes'] = np.add.reduceat(df['sum_seconds'].to_numpy(dtype=float), inicios) / total / 60.0
+    for q, coluna in zip(percentis, colunas_dos_percentis):
+        resumo[coluna] = percentis_do_histograma(df['bucket'].to_numpy(), contagens, inicios, q, largura_bucket) / 60.0
+    return resumo
+
+
+# Janela imediatamente anterior e de mesmo tamanho (ex: este mês x mês anterior)
+def periodo_anterior(start_date, end_date):
+    """Retorna (inicio, fim) do período de mesma duração que termina no dia anterior a `start_date`."""
+    duracao = end_date - start_date
+    fim_anterior = start_date - timedelta(days=1)
+    return fim_anterior - duracao, fim_anterior
+
+
+# Período inicial de análise das páginas: últimos MESES_DO_PERIODO_PADRAO meses até hoje
+def periodo_padrao(hoje=None):
+    """Retorna (inicio, fim) do período padrão dos filtros de data."""
+    hoje = hoje or date.today()
+    inicio = (pd.to_datetime(hoje) - pd.DateOffset(months=MESES_DO_PERIODO_PADRAO)).date()
+    return inicio, hoje
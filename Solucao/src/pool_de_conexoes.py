@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extensions import connection as ConexaoPsycopg
+
+
+# Conexão que guarda os nomes dos prepared statements já criados nela (ver src/consultas.py)
+class ConexaoComPreparadas(ConexaoPsycopg):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preparadas = set()
+
+
+# Pool de conexões compartilhado por todas as sessões do processo Streamlit
+class PoolDeConexoes:
+    """
+    Pool thread-safe de conexões com o Postgres.
+
+    Cada carregador faz checkout de uma conexão, executa a query e devolve a conexão
+    ao pool (checkin). Conexões ociosas há muito tempo passam por um health check
+    antes de serem entregues e conexões quebradas são descartadas e recriadas.
+    """
+
+    def __init__(self, minimo, maximo, timeout_checkout=30.0, ociosidade_health_check=30.0, **parametros_conexao):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout_checkout = timeout_checkout
+        self.ociosidade_health_check = ociosidade_health_check
+
+        parametros_conexao.setdefault('connection_factory', ConexaoComPreparadas)
+        self._pool = pg_pool.ThreadedConnectionPool(minimo, maximo, **parametros_conexao)
+        # O ThreadedConnectionPool abre `minimo` conexões já na criação, mas também FECHA toda
+        # conexão devolvida quando já há `minconn` ociosas: no pico, quase todo checkin fecharia
+        # a conexão (e com ela os prepared statements) e o próximo checkout reconectaria.
+        # Com minconn = maximo, ele guarda as ociosas até o máximo do pool.
+        self._pool.minconn = maximo
+        # O ThreadedConnectionPool não espera por vagas (lança PoolError), então o semáforo
+        # limita os checkouts simultâneos e faz as threads aguardarem a sua vez.
+        self._vagas = threading.BoundedSemaphore(maximo)
+        self._trava = threading.Lock()
+        # id(conn) -> instante do checkin, só para as conexões ociosas DENTRO do pool: a entrada
+        # sai no checkout e não é criada para conexões fechadas (o id poderia ser reaproveitado)
+        self._ultimo_uso = {}
+
+        # Métricas do pool
+        self._esperas = deque(maxlen=1000)
+        self._checkouts = 0
+        self._timeouts = 0
+        self._reconexoes = 0
+        self._em_uso = 0
+
+    def _conexao_saudavel(self, conn):
+        """Executa um SELECT 1 para confirmar que a conexão ainda responde."""
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            return True
+        except psycopg2.Error:
+            return False
+
+    def checkout(self):
+        """Retira uma conexão saudável do pool, aguardando até `timeout_checkout` segundos."""
+        inicio = time.perf_counter()
+        if not self._vagas.acquire(timeout=self.timeout_checkout):
+            with self._trava:
+                self._timeouts += 1
+            raise pg_pool.PoolError(
+                f"Nenhuma conexão livre no pool após {self.timeout_checkout:.0f} segundos (máximo: {self.maximo})."
+            )
+
+        try:
+            conn = self._conexao_verificada()
+            if not conn.autocommit:
+                conn.autocommit = True
+        except Exception:
+            self._vagas.release()
+            raise
+
+        espera = time.perf_counter() - inicio
+        with self._trava:
+            self._esperas.append(espera)
+            self._checkouts += 1
+            self._em_uso += 1
+        return conn
+
+    def _conexao_verificada(self):
+        """
+        Reconexão transparente: pede conexões ao pool até uma passar no health check.
+        Depois de um Postgres reiniciado, as outras conexões ociosas do pool também estão
+        quebradas: achada a primeira, todas as reaproveitadas seguintes são verificadas,
+        qualquer que seja a ociosidade. Conexões recém-criadas (nunca devolvidas) não são.
+        """
+        encontrou_quebrada = False
+        # Uma tentativa por conexão que o pool pode guardar, mais uma nova
+        for _ in range(self.maximo + 1):
+            conn = self._pool.getconn()
+            ocioso_desde = self._ultimo_uso.pop(id(conn), None)
+            precisa_verificar = conn.closed or (ocioso_desde is not None and (
+                encontrou_quebrada or time.monotonic() - ocioso_desde > self.ociosidade_health_check
+            ))
+            if not precisa_verificar or self._conexao_saudavel(conn):
+                return conn
+            self._pool.putconn(conn, close=True)
+            encontrou_quebrada = True
+            with self._trava:
+                self._reconexoes += 1
+        raise psycopg2.OperationalError(
+            f"Nenhuma conexão saudável após {self.maximo + 1} tentativas de reconexão."
+        )
+
+    def checkin(self, conn, descartar=False):
+        """Devolve a conexão ao pool. Conexões quebradas são fechadas em vez de reaproveitadas."""
+        try:
+            descartar = descartar or conn.closed
+            # Registrada ANTES do putconn: depois dele, outra thread já pode retirá-la do pool
+            if not descartar:
+                self._ultimo_uso[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=descartar)
+            # O putconn também fecha, sem avisar, conexões em estado desconhecido
+            if conn.closed:
+                self._ultimo_uso.pop(id(conn), None)
+        finally:
+            with self._trava:
+                self._em_uso -= 1
+            self._vagas.release()
+
+    @contextmanager
+    def conexao(self):
+        """Context manager de checkout/checkin usado pelos carregadores `carregar_*`."""
+        conn = self.checkout()
+        descartar = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Erro de conexão (ex: Postgres reiniciado): a conexão não volta para o pool
+            descartar = True
+            raise
+        finally:
+            self.checkin(conn, descartar=descartar)
+
+    def metricas(self):
+        """Retorna um dicionário com o estado do pool e as estatísticas de tempo de espera (ms)."""
+        with self._trava:
+            esperas = sorted(self._esperas)
+            metricas = {
+                'minimo': self.minimo,
+                'maximo': self.maximo,
+                'em_uso': self._em_uso,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'reconexoes': self._reconexoes,
+            }
+        if esperas:
+            metricas['espera_media_ms'] = 1000 * sum(esperas) / len(esperas)
+            metricas['espera_p95_ms'] = 1000 * esperas[min(len(esperas) - 1, int(0.95 * len(esperas)))]
+            metricas['espera_max_ms'] = 1000 * esperas[-1]
+        else:
+            metricas['espera_media_ms'] = metricas['espera_p95_ms'] = metricas['espera_max_ms'] = 0.0
+        return metricas
+
+    def fechar(self):
+        """Fecha todas as conexões do pool."""
+        self._pool.closeall()
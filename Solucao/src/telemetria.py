@@ -0,0 +1,285 @@
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+
+# --- TELEMETRIA DOS CARREGADORES ---
+# Cada chamada de um `carregar_*` gera um registro: de onde veio o resultado (cache local do
+# processo, cache compartilhado ou banco), tempo total, tempo de execução da query (servidor +
+# transferência), tempo de leitura/conversão, linhas e tamanho do resultado em memória.
+# O registro da chamada em andamento fica na thread (threading.local): o cache compartilhado
+# e o registro de consultas só "anotam" nele, sem precisar receber nada por parâmetro.
+
+ORIGENS = ('cache_local', 'cache_compartilhado', 'banco')
+# Últimas N chamadas de cada carregador usadas nos percentis
+JANELA_DE_PERCENTIS = 500
+# Acima disso a chamada é considerada lenta (aviso nas páginas)
+LIMITE_LENTO_MS = 500.0
+INTERVALO_DE_EXPORTACAO = 15.0
+
+_chamada_atual = threading.local()
+_trava = threading.Lock()
+_estatisticas = {}
+_ultimas_chamadas = {}
+_exportador = None
+
+
+def _novo_registro(carregador):
+    return {
+        'carregador': carregador,
+        'origem': 'cache_local',
+        'total_ms': 0.0,
+        'execucao_ms': 0.0,
+        'leitura_ms': 0.0,
+        'consultas': 0,
+        'linhas': 0,
+        'bytes': None,
+        'registrado_em': None,
+    }
+
+
+def anotar_origem(origem, leitura_ms=0.0):
+    """Marca de onde veio o resultado da chamada em andamento nesta thread."""
+    registro = getattr(_chamada_atual, 'registro', None)
+    if registro is not None:
+        registro['origem'] = origem
+        registro['leitura_ms'] += leitura_ms
+
+
+def anotar_consulta(execucao_ms, leitura_ms):
+    """Soma os tempos de uma query executada dentro da chamada em andamento."""
+    registro = getattr(_chamada_atual, 'registro', None)
+    if registro is not None:
+        registro['consultas'] += 1
+        registro['execucao_ms'] += execucao_ms
+        registro['leitura_ms'] += leitura_ms
+
+
+def _medir_resultado(registro, resultado):
+    partes = resultado if isinstance(resultado, tuple) else (resultado,)
+    frames = [parte for parte in partes if isinstance(parte, pd.DataFrame)]
+    tabelas = [parte for parte in partes if isinstance(parte, pa.Table)]
+    registro['linhas'] = sum(len(df) for df in frames) + sum(tabela.num_rows for tabela in tabelas)
+    # memory_usage(deep=True) percorre as strings: só vale a pena quando o resultado é novo
+    if registro['origem'] != 'cache_local':
+        registro['bytes'] = int(
+            sum(df.memory_usage(deep=True).sum() for df in frames) + sum(tabela.nbytes for tabela in tabelas)
+        )
+
+
+@contextmanager
+def medir_carregador(carregador, chave=None):
+    """Abre o registro de uma chamada de carregador; ao sair, acumula nas estatísticas."""
+    registro = _novo_registro(carregador)
+    anterior = getattr(_chamada_atual, 'registro', None)
+    _chamada_atual.registro = registro
+    inicio = time.perf_counter()
+    try:
+        yield registro
+    finally:
+        _chamada_atual.registro = anterior
+        registro['total_ms'] = 1000 * (time.perf_counter() - inicio)
+        registro['registrado_em'] = time.time()
+        _acumular(registro, chave)
+
+
+def medir_chamada(carregador, chave, executar):
+    """Executa `executar()` dentro de um registro de telemetria e mede o resultado."""
+    with medir_carregador(carregador, chave) as registro:
+        resultado = executar()
+        _medir_resultado(registro, resultado)
+    return resultado
+
+
+def _acumular(registro, chave):
+    with _trava:
+        estatisticas = _estatisticas.get(registro['carregador'])
+        if estatisticas is None:
+            estatisticas = _estatisticas[registro['carregador']] = {
+                'chamadas': {origem: 0 for origem in ORIGENS},
+                'tempos_ms': deque(maxlen=JANELA_DE_PERCENTIS),
+                'tempos_banco_ms': deque(maxlen=JANELA_DE_PERCENTIS),
+                'total_ms': 0.0,
+                'execucao_ms': 0.0,
+                'leitura_ms': 0.0,
+                'linhas': 0,
+                'bytes': None,
+            }
+        estatisticas['chamadas'][registro['origem']] += 1
+        estatisticas['tempos_ms'].append(registro['total_ms'])
+        if registro['origem'] == 'banco':
+            estatisticas['tempos_banco_ms'].append(registro['total_ms'])
+        estatisticas['total_ms'] += registro['total_ms']
+        estatisticas['execucao_ms'] += registro['execucao_ms']
+        estatisticas['leitura_ms'] += registro['leitura_ms']
+        estatisticas['linhas'] += registro['linhas']
+        if registro['bytes'] is not None:
+            estatisticas['bytes'] = registro['bytes']
+        if chave is not None:
+            _ultimas_chamadas[chave] = registro
+            if len(_ultimas_chamadas) > 10 * JANELA_DE_PERCENTIS:
+                _ultimas_chamadas.pop(next(iter(_ultimas_chamadas)))
+    _iniciar_exportador()
+
+
+# --- CONSULTA DAS ESTATÍSTICAS ---
+
+def _percentil(valores, q):
+    if not valores:
+        return None
+    return valores[min(len(valores) - 1, int(q * len(valores)))]
+
+
+def resumo_por_carregador():
+    """Uma linha por carregador: chamadas por origem, percentis de latência e médias."""
+    linhas = []
+    with _trava:
+        for carregador, e in sorted(_estatisticas.items()):
+            tempos = sorted(e['tempos_ms'])
+            tempos_banco = sorted(e['tempos_banco_ms'])
+            chamadas = sum(e['chamadas'].values())
+            linhas.append({
+                'carregador': carregador,
+                'chamadas': chamadas,
+                **e['chamadas'],
+                'taxa_de_acerto': 1 - e['chamadas']['banco'] / chamadas if chamadas else None,
+                'p50_ms': _percentil(tempos, 0.50),
+                'p95_ms': _percentil(tempos, 0.95),
+                'p99_ms': _percentil(tempos, 0.99),
+                'p50_banco_ms': _percentil(tempos_banco, 0.50),
+                'p95_banco_ms': _percentil(tempos_banco, 0.95),
+                'execucao_total_ms': e['execucao_ms'],
+                'leitura_total_ms': e['leitura_ms'],
+                'linhas_media': e['linhas'] / chamadas if chamadas else 0,
+                'bytes_ultimo_resultado': e['bytes'],
+            })
+    return linhas
+
+
+def ultima_chamada(carregador, **kwargs):
+    """Registro da última chamada de `carregador` com esses argumentos (None se não houver)."""
+    from .cache_compartilhado import chave_do_carregador
+
+    funcao = getattr(carregador, '__wrapped__', carregador)
+    with _trava:
+        return _ultimas_chamadas.get(chave_do_carregador(funcao, (), kwargs))
+
+
+def _formatar_bytes(n):
+    for unidade in ('B', 'KB', 'MB'):
+        if n < 1024:
+            return f"{n:.0f} {unidade}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def exibir_telemetria(carregador, **kwargs):
+    """Legenda com a origem, o tempo e o tamanho da última chamada (substitui as medições com time.time())."""
+    registro = ultima_chamada(carregador, **kwargs)
+    if registro is None:
+        return
+    origem = {'cache_local': "cache local", 'cache_compartilhado': "cache compartilhado", 'banco': "banco"}[registro['origem']]
+    partes = [f"{origem}: {registro['total_ms']:.0f} ms"]
+    if registro['origem'] == 'banco':
+        partes.append(f"query {registro['execucao_ms']:.0f} ms, leitura {registro['leitura_ms']:.0f} ms")
+    partes.append(f"{registro['linhas']:,} linhas".replace(",", "."))
+    if registro['bytes'] is not None:
+        partes.append(_formatar_bytes(registro['bytes']))
+    st.caption("Telemetria — " + " · ".join(partes))
+    if registro['origem'] == 'banco' and registro['total_ms'] > LIMITE_LENTO_MS:
+        st.warning("A latência está alta. Verifique o PostgreSQL ou a complexidade do JOIN.")
+
+
+# --- EXPORTAÇÃO (formato texto do Prometheus) ---
+
+def _rotulos(**rotulos):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in rotulos.items()) + "}"
+
+
+def formatar_prometheus(metricas_do_pool=None):
+    """Texto no formato de exposição do Prometheus com as métricas dos carregadores (e do pool)."""
+    linhas = [
+        "# HELP carregador_chamadas_total Chamadas de carregadores por origem do resultado.",
+        "# TYPE carregador_chamadas_total counter",
+    ]
+    resumo = resumo_por_carregador()
+    for r in resumo:
+        for origem in ORIGENS:
+            linhas.append(f"carregador_chamadas_total{_rotulos(carregador=r['carregador'], origem=origem)} {r[origem]}")
+    linhas += [
+        "# HELP carregador_latencia_ms Latência das últimas chamadas de cada carregador.",
+        "# TYPE carregador_latencia_ms summary",
+    ]
+    with _trava:
+        totais = {carregador: e['total_ms'] for carregador, e in _estatisticas.items()}
+    for r in resumo:
+        for q, chave in ((0.5, 'p50_ms'), (0.95, 'p95_ms'), (0.99, 'p99_ms')):
+            linhas.append(f"carregador_latencia_ms{_rotulos(carregador=r['carregador'], quantile=q)} {r[chave] or 0:.3f}")
+        linhas.append(f"carregador_latencia_ms_sum{_rotulos(carregador=r['carregador'])} {totais[r['carregador']]:.3f}")
+        linhas.append(f"carregador_latencia_ms_count{_rotulos(carregador=r['carregador'])} {r['chamadas']}")
+    for nome, chave, ajuda in (
+        ('carregador_execucao_ms_total', 'execucao_total_ms', "Tempo de execução das queries (servidor + transferência)."),
+        ('carregador_leitura_ms_total', 'leitura_total_ms', "Tempo de leitura/conversão dos resultados."),
+    ):
+        linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} counter"]
+        linhas += [f"{nome}{_rotulos(carregador=r['carregador'])} {r[chave]:.3f}" for r in resumo]
+    linhas += ["# HELP carregador_resultado_bytes Tamanho em memória do último resultado.", "# TYPE carregador_resultado_bytes gauge"]
+    linhas += [
+        f"carregador_resultado_bytes{_rotulos(carregador=r['carregador'])} {r['bytes_ultimo_resultado']}"
+        for r in resumo if r['bytes_ultimo_resultado'] is not None
+    ]
+    if metricas_do_pool:
+        linhas += ["# HELP pool_conexoes Estado e tempos de espera do pool de conexões.", "# TYPE pool_conexoes gauge"]
+        linhas += [f"pool_conexoes{_rotulos(metrica=nome)} {valor}" for nome, valor in metricas_do_pool.items()]
+    return "\n".join(linhas) + "\n"
+
+
+def exportar_prometheus(caminho):
+    """Grava as métricas em `caminho` (escrita atômica, para o coletor nunca ler um arquivo pela metade)."""
+    from .carregamento_de_dados import conexao_banco_de_dados
+
+    try:
+        metricas_do_pool = conexao_banco_de_dados().metricas()
+    except Exception:
+        metricas_do_pool = None
+    diretorio = os.path.dirname(caminho) or '.'
+    os.makedirs(diretorio, exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, suffix='.tmp')
+    with os.fdopen(descritor, 'w', encoding='utf-8') as arquivo:
+        arquivo.write(formatar_prometheus(metricas_do_pool))
+    os.replace(temporario, caminho)
+
+
+def _exportar_periodicamente(caminho):
+    while True:
+        time.sleep(INTERVALO_DE_EXPORTACAO)
+        try:
+            exportar_prometheus(caminho)
+        except Exception as e:
+            print(f"✗ Falha ao exportar métricas: {e}")
+
+
+def _iniciar_exportador():
+    """Inicia (uma vez por processo) a thread que exporta as métricas para o arquivo configurado."""
+    global _exportador
+    if _exportador is not None:
+        return
+    with _trava:
+        if _exportador is not None:
+            return
+        try:
+            config = st.secrets.get("telemetria", {})
+        except Exception:
+            config = {}
+        caminho = config.get("arquivo_metricas", os.path.join('.cache', 'metricas.prom'))
+        _exportador = threading.Thread(
+            target=_exportar_periodicamente, args=(caminho,), name='exportador-metricas', daemon=True
+        )
+        _exportador.start()
@@ -0,0 +1,114 @@
+import functools
+import threading
+
+import pandas as pd
+
+
+# --- TIPOS COMPACTOS DOS RESULTADOS ---
+# Os resultados dos carregadores chegam com nomes em `object`, EXTRACT em float64 e médias
+# (AVG de numeric) em float64. Cada combinação de filtros vira uma entrada de cache serializada:
+# com milhares de entradas, o tipo das colunas define a memória e o tempo de (de)serialização.
+# O esquema abaixo vale para qualquer carregador: só as colunas presentes são convertidas.
+ESQUEMA_COMPACTO = {
+    # Nomes de dimensão: poucos valores distintos repetidos em muitas linhas
+    'product_name': 'category',
+    'store_name': 'category',
+    'channel_name': 'category',
+    'neighborhood': 'category',
+    'segmento': 'category',
+    'frequency_group': 'category',
+    # Dia da semana e hora
+    'day_of_week': 'int8',
+    'day_of_week_num': 'int8',
+    'hour_of_day': 'int8',
+    'nivel': 'int8',
+    # Minutos de entrega
+    'avg_delivery_minutes': 'float32',
+    'p50_delivery_minutes': 'float32',
+    'p90_delivery_minutes': 'float32',
+    'p99_delivery_minutes': 'float32',
+    # Tickets, preços e margens médios (somas como sum_amount continuam float64: re-agregação exata)
+    'avg_ticket': 'float32',
+    'avg_sale_price': 'float32',
+    'avg_base_price': 'float32',
+    'estimated_margin': 'float32',
+    'estimated_margin_percent': 'float32',
+    'avg_recency_days': 'float32',
+    'avg_frequency': 'float32',
+    'avg_m_score': 'float32',
+    # Contagens e ids
+    'store_id': 'int32',
+    'sale_count': 'int32',
+    'total_deliveries': 'int32',
+    'total_clientes': 'int32',
+    'frequency': 'int32',
+    'recency_days': 'int32',
+    'customer_id': 'int32',
+}
+
+_trava = threading.Lock()
+_relatorio = {}
+
+
+def _tipo_da_coluna(serie, tipo):
+    """Inteiros com nulos viram o inteiro anulável equivalente (int32 -> Int32)."""
+    if tipo.startswith('int') and serie.isna().any():
+        return tipo.capitalize()
+    return tipo
+
+
+def compactar(df, esquema=ESQUEMA_COMPACTO):
+    """Converte as colunas de `df` presentes no esquema para os tipos compactos."""
+    tipos = {
+        coluna: _tipo_da_coluna(df[coluna], tipo)
+        for coluna, tipo in esquema.items()
+        if coluna in df.columns and str(df[coluna].dtype) != tipo
+    }
+    return df.astype(tipos) if tipos else df
+
+
+def _bytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _registrar(carregador, antes, depois):
+    with _trava:
+        r = _relatorio.setdefault(carregador, {'entradas': 0, 'bytes_antes': 0, 'bytes_depois': 0})
+        r['entradas'] += 1
+        r['bytes_antes'] += antes
+        r['bytes_depois'] += depois
+        r['ultima_entrada_antes'] = antes
+        r['ultima_entrada_depois'] = depois
+
+
+def compactar_resultado(funcao):
+    """Decorator: compacta os DataFrames retornados (inclusive dentro de tuplas) e mede a economia."""
+    @functools.wraps(funcao)
+    def carregador(*args, **kwargs):
+        resultado = funcao(*args, **kwargs)
+        partes = resultado if isinstance(resultado, tuple) else (resultado,)
+        antes = depois = 0
+        compactadas = []
+        for parte in partes:
+            if isinstance(parte, pd.DataFrame):
+                antes += _bytes(parte)
+                parte = compactar(parte)
+                depois += _bytes(parte)
+            compactadas.append(parte)
+        if antes:
+            _registrar(funcao.__name__, antes, depois)
+        return tuple(compactadas) if isinstance(resultado, tuple) else compactadas[0]
+    return carregador
+
+
+def relatorio_de_compactacao():
+    """Por carregador: entradas compactadas e memória antes/depois (total e da última entrada)."""
+    with _trava:
+        return [
+            {
+                'carregador': carregador,
+                **r,
+                'reducao': 1 - r['bytes_depois'] / r['bytes_antes'] if r['bytes_antes'] else 0.0,
+            }
+            for carregador, r in sorted(_relatorio.items())
+        ]
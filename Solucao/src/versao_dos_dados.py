@@ -0,0 +1,261 @@
+import functools
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from .cache_compartilhado import cache_compartilhado, chave_do_carregador
+from .consultas import registrar_consulta, executar_consulta
+from .telemetria import medir_chamada, medir_carregador, anotar_origem
+from .tipos_compactos import compactar_resultado
+
+
+# --- VERSÃO DOS DADOS ---
+# Em vez de TTLs fixos, cada carregador declara as tabelas que lê e a "versão" dessas tabelas
+# entra na chave do cache. A versão vem dos contadores de inserções/atualizações/remoções do
+# próprio Postgres (pg_stat_user_tables): uma consulta de catálogo barata, sem varrer dados.
+# Se nada mudou, o resultado em cache vale indefinidamente; se chegou uma venda nova, a
+# versão muda e a próxima chamada recalcula.
+# Os contadores não são monotônicos: um pg_stat_reset(), um crash ou um reinício os zeram, e a
+# soma poderia voltar a um valor já visto (servindo entradas antigas como atuais). Por isso a
+# versão também leva o instante do último reset das estatísticas do banco, o início do servidor
+# e o maior id de cada tabela (lido pelo índice da chave primária, não volta atrás com resets).
+registrar_consulta("versao_das_tabelas", """
+    SELECT
+        t.relname,
+        t.n_tup_ins + t.n_tup_upd + t.n_tup_del AS alteracoes,
+        CASE WHEN a.attname IS NOT NULL THEN (xpath('/row/m/text()', query_to_xml(
+            format('SELECT max(id) AS m FROM %I.%I', t.schemaname, t.relname), false, true, ''
+        )))[1]::text END AS maior_id,
+        d.stats_reset::text AS estatisticas_zeradas_em,
+        pg_postmaster_start_time()::text AS servidor_iniciado_em
+    FROM pg_stat_user_tables t
+    LEFT JOIN pg_attribute a ON a.attrelid = t.relid AND a.attname = 'id' AND NOT a.attisdropped
+    JOIN pg_stat_database d ON d.datname = current_database()
+    WHERE t.relname = ANY($1::text[])
+    ORDER BY t.relname;
+""", parametros=("tabelas",))
+
+# Intervalo mínimo entre duas sondas (todas as sessões do processo compartilham o resultado)
+INTERVALO_DA_SONDA = 5.0
+# Nome da sonda na telemetria: ela tem registro próprio e não entra no do carregador que a chamou
+CARREGADOR_DA_SONDA = "versao_das_tabelas"
+# Se a sonda falhar, as versões passam a girar a cada N segundos (comportamento de TTL)
+TTL_SEM_VERSAO = 360
+
+_sondas = {}
+_trava_sondas = threading.Lock()
+
+
+def _sondar(tabelas):
+    from .carregamento_de_dados import conexao_banco_de_dados
+
+    pool = conexao_banco_de_dados()
+    with pool.conexao() as conn:
+        df = executar_consulta(conn, "versao_das_tabelas", tabelas=list(tabelas))
+    assinatura = ";".join(
+        f"{linha.relname}={linha.alteracoes}/{linha.maior_id}@{linha.estatisticas_zeradas_em}@{linha.servidor_iniciado_em}"
+        for linha in df.itertuples()
+    )
+    return hashlib.sha256(assinatura.encode('utf-8')).hexdigest()[:16]
+
+
+def versao_das_tabelas(tabelas):
+    """Versão atual (hash curto) do conjunto de tabelas, sondada no máximo a cada INTERVALO_DA_SONDA segundos."""
+    tabelas = tuple(sorted(tabelas))
+    agora = time.monotonic()
+    with _trava_sondas:
+        sonda = _sondas.get(tabelas)
+        if sonda is not None and agora - sonda[0] < INTERVALO_DA_SONDA:
+            return sonda[1]
+    try:
+        with medir_carregador(CARREGADOR_DA_SONDA):
+            anotar_origem('banco')
+            versao = _sondar(tabelas)
+    except Exception:
+        versao = f"sem-versao-{int(time.time() // TTL_SEM_VERSAO)}"
+    with _trava_sondas:
+        _sondas[tabelas] = (agora, versao)
+    return versao
+
+
+# --- REVALIDAÇÃO EM SEGUNDO PLANO (stale-while-revalidate) ---
+# Quando a versão dos dados muda, a próxima chamada pagaria a query inteira. Para combinações
+# de filtros populares ("quentes") isso não acontece: um agendador percebe a nova versão e
+# recalcula a entrada numa thread, e as sessões continuam recebendo o resultado da versão
+# anterior até o novo ficar pronto. No modo sem versão (sonda falhando), o mesmo mecanismo
+# renova as entradas quentes a cada TTL_SEM_VERSAO segundos.
+
+# Acessos mínimos para uma entrada ser quente, e por quanto tempo ela continua quente sem acessos
+ACESSOS_PARA_QUENTE = 2
+JANELA_QUENTE = 30 * 60
+MAX_ENTRADAS_MONITORADAS = 500
+TRABALHADORES_DE_ATUALIZACAO = 2
+
+_entradas = {}
+_trava_entradas = threading.Lock()
+_executor = None
+
+
+def _obter_executor():
+    """Cria (uma vez por processo) o pool de atualização e a thread do agendador."""
+    global _executor
+    with _trava_entradas:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=TRABALHADORES_DE_ATUALIZACAO, thread_name_prefix='revalidacao')
+            threading.Thread(target=_agendador, name='agendador-revalidacao', daemon=True).start()
+    return _executor
+
+
+def _quente(entrada, agora=None):
+    agora = agora or time.time()
+    return entrada['acessos'] >= ACESSOS_PARA_QUENTE and agora - entrada['ultimo_acesso'] <= JANELA_QUENTE
+
+
+def _registrar_acesso(chave, nome, tabelas, em_segundo_plano, args, kwargs):
+    agora = time.time()
+    with _trava_entradas:
+        entrada = _entradas.get(chave)
+        if entrada is None:
+            if len(_entradas) >= MAX_ENTRADAS_MONITORADAS:
+                # Descarta a entrada acessada há mais tempo
+                del _entradas[min(_entradas, key=lambda c: _entradas[c]['ultimo_acesso'])]
+            entrada = _entradas[chave] = {
+                'carregador': nome,
+                'parametros': ", ".join([repr(a) for a in args] + [f"{k}={v!r}" for k, v in kwargs.items()]),
+                'tabelas': tabelas,
+                'executar': em_segundo_plano,
+                'args': args,
+                'kwargs': kwargs,
+                'acessos': 0,
+                'ultimo_acesso': agora,
+                'versao_pronta': None,
+                'atualizando': False,
+                'atualizacoes': 0,
+                'falhas': 0,
+                'ultima_atualizacao_ms': None,
+                'atualizado_em': None,
+                'ultimo_erro': None,
+            }
+        entrada['acessos'] += 1
+        entrada['ultimo_acesso'] = agora
+    return entrada
+
+
+def _agendar_atualizacao(entrada, versao):
+    with _trava_entradas:
+        if entrada['atualizando']:
+            return
+        entrada['atualizando'] = True
+    _obter_executor().submit(_atualizar, entrada, versao)
+
+
+def _atualizar(entrada, versao):
+    inicio = time.perf_counter()
+    try:
+        entrada['executar'](versao, *entrada['args'], **entrada['kwargs'])
+    except Exception as e:
+        # Mantém o resultado anterior; o agendador tenta de novo no próximo ciclo
+        with _trava_entradas:
+            entrada['falhas'] += 1
+            entrada['ultimo_erro'] = str(e)
+            entrada['atualizando'] = False
+        return
+    with _trava_entradas:
+        entrada['versao_pronta'] = versao
+        entrada['atualizacoes'] += 1
+        entrada['ultima_atualizacao_ms'] = 1000 * (time.perf_counter() - inicio)
+        entrada['atualizado_em'] = time.time()
+        entrada['ultimo_erro'] = None
+        entrada['atualizando'] = False
+
+
+def _agendador():
+    """A cada INTERVALO_DA_SONDA segundos, recalcula as entradas quentes cuja versão mudou."""
+    while True:
+        time.sleep(INTERVALO_DA_SONDA)
+        agora = time.time()
+        with _trava_entradas:
+            quentes = [e for e in _entradas.values() if _quente(e, agora) and not e['atualizando']]
+        for entrada in quentes:
+            versao = versao_das_tabelas(entrada['tabelas'])
+            if versao != entrada['versao_pronta']:
+                _agendar_atualizacao(entrada, versao)
+
+
+def metricas_de_revalidacao():
+    """Estado de cada entrada monitorada (acessos, atualizações em segundo plano e seus tempos)."""
+    agora = time.time()
+    with _trava_entradas:
+        return sorted((
+            {
+                'carregador': e['carregador'],
+                'parametros': e['parametros'],
+                'quente': _quente(e, agora),
+                'acessos': e['acessos'],
+                'atualizando': e['atualizando'],
+                'atualizacoes': e['atualizacoes'],
+                'falhas': e['falhas'],
+                'ultima_atualizacao_ms': e['ultima_atualizacao_ms'],
+                'atualizado_em': e['atualizado_em'],
+                'ultimo_erro': e['ultimo_erro'],
+            }
+            for e in _entradas.values()
+        ), key=lambda e: -e['acessos'])
+
+
+def cache_versionado(*tabelas, max_entries=1000):
+    """
+    Substitui @st.cache_data(ttl=...) nos carregadores. O cache local (st.cache_data) e o
+    compartilhado (src/cache_compartilhado.py) passam a ser chaveados também pela versão
+    das `tabelas`, sem expiração por tempo: invalidam exatamente quando os dados mudam.
+    Entradas quentes são revalidadas em segundo plano (ver acima).
+    """
+    def decorador(funcao):
+        # Compacta os tipos antes de qualquer cache: as duas camadas guardam o resultado compacto
+        carregador = cache_compartilhado(versao=lambda: versao_das_tabelas(tabelas))(compactar_resultado(funcao))
+
+        def por_versao(versao_dados, *args, **kwargs):
+            return carregador(*args, **kwargs)
+
+        # O st.cache_data identifica a função pelo módulo + nome qualificado: cada carregador
+        # precisa de um nome próprio para não dividir a mesma área de cache
+        por_versao.__module__ = funcao.__module__
+        por_versao.__qualname__ = f"{funcao.__qualname__}_por_versao"
+        em_cache = st.cache_data(max_entries=max_entries, show_spinner=f"Running {funcao.__name__}(...).")(por_versao)
+        # Mesma função => mesma área de cache; sem spinner porque roda fora do script da sessão
+        # (revalidação em segundo plano e as threads de src/execucao_paralela.py)
+        em_segundo_plano = st.cache_data(max_entries=max_entries, show_spinner=False)(por_versao)
+
+        def carregar(chave, args, kwargs, ler):
+            versao = versao_das_tabelas(tabelas)
+            entrada = _registrar_acesso(chave, funcao.__name__, tabelas, em_segundo_plano, args, kwargs)
+            versao_pronta = entrada['versao_pronta']
+            if versao_pronta is not None and versao_pronta != versao and _quente(entrada):
+                # Serve o resultado anterior enquanto a nova versão é calculada
+                _agendar_atualizacao(entrada, versao)
+                return ler(versao_pronta, *args, **kwargs)
+
+            resultado = ler(versao, *args, **kwargs)
+            with _trava_entradas:
+                entrada['versao_pronta'] = versao
+            _obter_executor()
+            return resultado
+
+        @functools.wraps(funcao)
+        def carregador_versionado(*args, **kwargs):
+            chave = chave_do_carregador(funcao, args, kwargs)
+            return medir_chamada(funcao.__name__, chave, lambda: carregar(chave, args, kwargs, em_cache))
+
+        def sem_spinner(*args, **kwargs):
+            """Mesma chamada (e mesmas entradas de cache), sem o spinner do st.cache_data."""
+            chave = chave_do_carregador(funcao, args, kwargs)
+            return medir_chamada(funcao.__name__, chave, lambda: carregar(chave, args, kwargs, em_segundo_plano))
+
+        carregador_versionado.clear = em_cache.clear
+        carregador_versionado.sem_spinner = sem_spinner
+        carregador_versionado.tabelas = tabelas
+        return carregador_versionado
+    return decorador